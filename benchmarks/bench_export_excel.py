@@ -0,0 +1,75 @@
+"""
+Compare the write-only excel export with building a full workbook.
+
+Run from the repository root:
+
+    python benchmarks/bench_export_excel.py --rows 100000 --columns 20
+
+Reports wall time and the peak of memory allocated by Python for both.
+"""
+
+import argparse
+import time
+import tracemalloc
+from tempfile import NamedTemporaryFile
+
+from openpyxl import Workbook
+
+from spynl.main.serial.file_responses import export_data, export_excel
+
+
+def export_excel_in_memory(header, data):
+    """The export as it was before: a full workbook and a 2D list."""
+    tmp = NamedTemporaryFile()
+    wb = Workbook()
+    ws = wb.active
+
+    ws.append(header)
+    for row in export_data(data, header):
+        ws.append(row)
+
+    wb.save(tmp.name)
+    tmp.seek(0)
+
+    return tmp
+
+
+def make_rows(rows, columns):
+    """Generate rows of mixed values."""
+    header = ['column%d' % i for i in range(columns)]
+    for i in range(rows):
+        yield {
+            key: (i * j if j % 2 else 'value %d' % (i + j))
+            for j, key in enumerate(header)
+        }
+
+
+def measure(function, rows, columns):
+    """Return seconds and peak traced memory (MiB) for one export."""
+    header = ['column%d' % i for i in range(columns)]
+    data = list(make_rows(rows, columns))
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(header, data).close()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--columns', type=int, default=20)
+    args = parser.parse_args()
+
+    for name, function in (
+        ('in-memory workbook', export_excel_in_memory),
+        ('write-only workbook', export_excel),
+    ):
+        seconds, peak = measure(function, args.rows, args.columns)
+        print('{:<20} {:8.2f}s {:10.1f} MiB peak'.format(name, seconds, peak))
+
+
+if __name__ == '__main__':
+    main()
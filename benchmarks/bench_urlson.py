@@ -0,0 +1,38 @@
+"""
+Time urlson.loads on filter queries of growing length.
+
+Run from the repository root:
+
+    python benchmarks/bench_urlson.py
+
+With a linear parser, the time per KB stays about the same as the query
+grows.
+"""
+
+import timeit
+
+from spynl.main import urlson
+
+
+def make_filter(fields):
+    """Return a filter query like the ones clients send in GET parameters."""
+    return '{' + ','.join(
+        'field%d:{$in:[a%d,b%d,c%d]},other%d:value' % ((i,) * 5)
+        for i in range(fields)
+    ) + '}'
+
+
+def main():
+    for fields in (10, 100, 1000, 5000):
+        query = make_filter(fields)
+        number = max(1, 20000 // fields)
+        seconds = timeit.timeit(lambda: urlson.loads(query), number=number) / number
+        print(
+            '{:>8} bytes {:10.3f} ms {:8.3f} ms/KB'.format(
+                len(query), seconds * 1000, seconds * 1000 * 1024 / len(query)
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare the pure Python YAML loader and dumper with the libyaml ones.
+
+Run from the repository root:
+
+    python benchmarks/bench_yaml.py --documents 2000
+
+Reports the best wall time of a few rounds of loading and dumping a list of
+documents with both.
+"""
+
+import argparse
+import timeit
+
+import yaml
+
+
+def make_documents(documents):
+    """Return a list of documents with a bit of nesting."""
+    return [
+        {
+            'sku': 'SKU%d' % i,
+            'name': 'product %d' % i,
+            'price': i * 1.25,
+            'active': bool(i % 2),
+            'sizes': ['S', 'M', 'L'],
+            'stock': {'warehouse': i, 'shop': i % 7},
+        }
+        for i in range(documents)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--documents', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_documents(args.documents)
+    text = yaml.dump(data, Dumper=yaml.SafeDumper)
+
+    implementations = [('pure Python', yaml.SafeLoader, yaml.SafeDumper)]
+    if hasattr(yaml, 'CSafeLoader'):
+        implementations.append(('libyaml', yaml.CSafeLoader, yaml.CSafeDumper))
+    else:
+        print('libyaml is not available, only the pure Python version is timed')
+
+    for name, loader, dumper in implementations:
+        load = min(
+            timeit.repeat(
+                lambda: yaml.load(text, Loader=loader), number=1, repeat=args.rounds
+            )
+        )
+        dump = min(
+            timeit.repeat(
+                lambda: yaml.dump(data, Dumper=dumper), number=1, repeat=args.rounds
+            )
+        )
+        print('{:<12} load {:8.3f}s  dump {:8.3f}s'.format(name, load, dump))
+
+
+if __name__ == '__main__':
+    main()
@@ -77,6 +77,7 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=install_requires,
+    extras_require={'orjson': ['orjson']},
     setup_requires=pytest_runner_dependency() + ['PasteScript'],
     test_suite="spynl",
     entry_points={
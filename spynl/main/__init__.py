@@ -7,9 +7,24 @@ from pyramid.viewderivers import INGRESS
 
 from marshmallow import ValidationError
 
-from spynl.main import serial, about, plugins, routing, events, endpoints, session
-
-from spynl.main.utils import renderer_factory, check_origin, handle_pre_flight_request
+from spynl.main import (
+    serial,
+    about,
+    plugins,
+    routing,
+    events,
+    endpoints,
+    session,
+    timing,
+)
+
+from spynl.main.utils import (
+    renderer_factory,
+    check_origin,
+    handle_pre_flight_request,
+    user_info_cache,
+    unify_args,
+)
 
 
 from spynl.main.exceptions import SpynlException
@@ -17,7 +32,7 @@ from spynl.main.error_views import spynl_error, error400, error500, validation_e
 
 from spynl.main.docs.documentation import make_docs
 from spynl.main.docs.settings import check_required_settings
-from spynl.main.dateutils import now
+from spynl.main.dateutils import now, date_context
 from spynl.main.locale import TemplateTranslations
 from spynl.main.utils import add_jinja2_filters
 
@@ -54,6 +69,10 @@ def main_includeme(config):
     config.add_view_deriver(handle_pre_flight_request, under=INGRESS)
     config.add_view_deriver(check_origin)
 
+    config.add_request_method(user_info_cache, reify=True)
+    config.add_request_method(date_context, reify=True)
+    config.add_request_method(unify_args, 'args', reify=True)
+
     # initialize the main plugins
     # serial should be before plugins, because plugins can overwrite field
     # treatment
@@ -66,6 +85,8 @@ def main_includeme(config):
     about.main(config)
     plugins.main(config)
     session.main(config)
+    # timing needs to be last, so it can record all other subscribers
+    timing.main(config)
 
     check_required_settings(config)
 
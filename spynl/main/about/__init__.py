@@ -7,7 +7,7 @@ from pyramid.settings import asbool
 from pyramid.security import Allow, Authenticated, DENY_ALL
 
 from spynl.main.routing import Resource
-from spynl.main.about.endpoints import hello, versions, build, ini
+from spynl.main.about.endpoints import hello, versions, build, ini, timings
 
 
 class AboutResource(Resource):
@@ -61,3 +61,6 @@ def main(config):
         build, 'build', context=AboutResource, permission=NO_PERMISSION_REQUIRED
     )
     config.add_endpoint(ini, 'ini', context=AboutResource, permission=permission)
+    config.add_endpoint(
+        timings, 'timings', context=AboutResource, permission=permission
+    )
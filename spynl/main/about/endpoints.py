@@ -12,8 +12,9 @@ from pyramid.i18n import negotiate_locale_name
 from spynl.main.exceptions import SpynlException
 from spynl.main.version import __version__ as spynl_version
 from spynl.main.utils import get_settings
+from spynl.main.serial.objects import encode_stats
 from spynl.main.locale import SpynlTranslationString as _
-from spynl.main.dateutils import now, date_to_str
+from spynl.main.dateutils import now, date_to_str, date_parse_stats
 from spynl.main.docs.settings import ini_doc, ini_description
 from spynl.main.pkg_utils import get_spynl_packages
 
@@ -154,3 +155,40 @@ def ini(request):
         request=request,
     )
     return result
+
+
+def timings(request):
+    """
+    Histograms of how long the stages of requests take, per endpoint.
+
+    ---
+    get:
+      tags:
+        - about
+      description: >
+        Only filled if the setting spynl.timing is true.
+
+
+        Requires 'read' permission for the 'about' resource.
+
+        ### Response
+
+        JSON keys | Content Type | Description\n
+        --------- | ------------ | -----------\n
+        status    | string | 'ok' or 'error'\n
+        enabled   | boolean | Whether requests are timed.\n
+        timings   | dict   | {endpoint: {stage: {count, mean_ms, max_ms,
+        buckets: {upper bound in ms: count}}}}. Stages are the event
+        subscribers, view, renderer and total.\n
+        encode_hits | dict | {type: count} of values encoded with a cached
+        encode function.\n
+        date_parses | dict | {hit, miss}: dates parsed without and with
+        dateutil.\n
+    """
+    histograms = get_settings().get('spynl.timing.histograms')
+    return {
+        'enabled': histograms is not None,
+        'timings': histograms.as_dict() if histograms is not None else {},
+        'encode_hits': encode_stats(),
+        'date_parses': date_parse_stats.as_dict(),
+    }
@@ -3,12 +3,104 @@ Functions for handling dates and times.
 """
 
 from datetime import datetime
+from functools import lru_cache
+import threading
 import dateutil.parser  # pylint: disable=E0611
 from pytz import utc, timezone
 
 from spynl.main.utils import get_request, get_settings, get_user_info
 
 
+class ParseStats(object):
+    """
+    Counts of dates parsed without dateutil (hit) and by dateutil (miss).
+    Requests run in threads, so the counts are updated under a lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {'hit': 0, 'miss': 0}
+
+    def add(self, key):
+        """Count one date for key."""
+        with self.lock:
+            self.counts[key] += 1
+
+    def __getitem__(self, key):
+        return self.counts[key]
+
+    def as_dict(self):
+        """Return the counts as a dictionary."""
+        with self.lock:
+            return dict(self.counts)
+
+
+date_parse_stats = ParseStats()
+
+# not available before Python 3.7
+_fromisoformat = getattr(datetime, 'fromisoformat', None)
+
+
+DEFAULT_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+
+
+@lru_cache(maxsize=256)
+def get_timezone(name):
+    """Return the timezone object for name, made once."""
+    return timezone(name)
+
+
+class DateContext(object):
+    """
+    The date settings of a request, resolved once: the date format, the
+    system timezone and, when first needed, the timezone of the user.
+    """
+
+    def __init__(self, settings, request=None):
+        self.format = settings.get('spynl.date_format', DEFAULT_DATE_FORMAT)
+        self.system_tz = get_timezone(settings.get('spynl.date_systemtz', 'UTC'))
+        self.request = request
+        self._user_tz = None
+
+    @property
+    def user_tz(self):
+        """The timezone from the user information, or the system timezone."""
+        if self._user_tz is None:
+            tz = self.system_tz
+            if self.request is not None:
+                user_tz = get_user_info(self.request).get('tz')
+                if user_tz:
+                    tz = get_timezone(user_tz)
+            self._user_tz = tz
+        return self._user_tz
+
+    def localize(self, when, user_specific=True):
+        """Localise when to the user or system timezone, see localize_date."""
+        if not when.tzinfo:
+            when = when.replace(tzinfo=utc)
+        return when.astimezone(self.user_tz if user_specific else self.system_tz)
+
+    def to_str(self, when):
+        """Convert date to string according to the date format."""
+        return when.strftime(self.format)
+
+
+def date_context(request):
+    """The DateContext of a request, added as a reified request property."""
+    return DateContext(request.registry.settings, request)
+
+
+def get_date_context():
+    """Return the DateContext of the current request, or one for the settings."""
+    request = get_request()
+    if request is not None:
+        try:
+            return request.date_context
+        except AttributeError:  # e.g. a DummyRequest in tests
+            pass
+    return DateContext(get_settings(), request)
+
+
 def now(tz=None):
     """Current time, with timezone localised."""
     return localize_date(datetime.utcnow(), tz=tz)
@@ -16,27 +108,47 @@ def now(tz=None):
 
 def date_format_str():
     """Get the date format from the .ini file, or set default."""
-    return get_settings().get('spynl.date_format', '%Y-%m-%dT%H:%M:%S%z')
+    return get_date_context().format
 
 
 def date_to_str(when):
     """Convert date to string according to settings format"""
-    return when.strftime(date_format_str())
+    return when.strftime(get_date_context().format)
 
 
 def date_from_str(dstr):
     """
     Parses a string to a date/time and adds current timezone if no timezone
     information is present.
+
+    ISO 8601 strings and strings in the configured date format are parsed
+    directly, anything else by dateutil, which is a lot slower but can
+    handle different inputs. date_parse_stats counts both cases.
     """
-    # slightly slower than datetime.strptime
-    # but can handle different inputs
-    _when = dateutil.parser.parse(dstr)  # pylint: disable=no-member
+    _when = _parse_known_formats(dstr)
+    if _when is None:
+        date_parse_stats.add('miss')
+        _when = dateutil.parser.parse(dstr)  # pylint: disable=no-member
+    else:
+        date_parse_stats.add('hit')
     if not _when.tzinfo:  # pylint: disable=E1103
         _when = utc.localize(_when)
     return _when
 
 
+def _parse_known_formats(dstr):
+    """Return dstr parsed as ISO 8601 or the date format, or None."""
+    if _fromisoformat is not None:
+        try:
+            return _fromisoformat(dstr)
+        except (TypeError, ValueError):
+            pass
+    try:
+        return datetime.strptime(dstr, get_date_context().format)
+    except (TypeError, ValueError):
+        return None
+
+
 def localize_date(when, user_specific=True, tz=None):
     """
     Localises datetime objects to a time zone.
@@ -46,13 +158,7 @@ def localize_date(when, user_specific=True, tz=None):
     then we assume it represents UTC time.
     """
     if not tz:
-        tz = get_settings().get('spynl.date_systemtz', 'UTC')
-        if user_specific:
-            request = get_request()
-            if request:  # e.g. in testing there might be no request
-                user_info = get_user_info(request)
-                if user_info.get('tz'):
-                    tz = user_info.get('tz')
+        return get_date_context().localize(when, user_specific)
     if not when.tzinfo:
         when = when.replace(tzinfo=utc)
-    return when.astimezone(timezone(tz))
+    return when.astimezone(get_timezone(tz))
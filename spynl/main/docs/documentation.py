@@ -8,6 +8,7 @@ import re
 import yaml
 
 from spynl.main.version import __version__ as spynl_version
+from spynl.main.serial.yaml import SafeLoader
 from spynl.main.utils import get_logger, get_yaml_from_docstring
 from spynl.main.docs.settings import get_ini_doc_setting
 
@@ -55,7 +56,7 @@ def document_endpoint(config, function, endpoint_name, resource=None):
         yaml_str = re.sub(r'\$resource', resource, yaml_str)
     try:
         yaml_str = insert_ini_settings(config, yaml_str)
-        yaml_doc = yaml.load(yaml_str, Loader=yaml.FullLoader)
+        yaml_doc = yaml.load(yaml_str, Loader=SafeLoader)
         # If a path has a different view for get and post, add both
         if path in swagger_doc['paths']:
             swagger_doc['paths'][path].update(yaml_doc)
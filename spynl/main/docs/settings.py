@@ -89,6 +89,41 @@ ini_doc = [
         'info': 'Pretty printing for development. Is read with Pyramid '
         'asbool function.',
     },
+    {
+        'name': 'spynl.json_backend',
+        'plugin': '',
+        'required': 'no',
+        'default': 'json',
+        'info': 'The library used to parse and write JSON: json (the '
+        'standard library) or orjson, if it is installed. Pretty printed '
+        'output is always written with json.',
+    },
+    {
+        'name': 'spynl.timing',
+        'plugin': '',
+        'required': 'no',
+        'default': 'false',
+        'info': 'Time the stages of every request. The durations are sent in '
+        'a Server-Timing header and kept per endpoint for /about/timings, '
+        'as are counts of encoded values per type. '
+        'Is read with Pyramid asbool function.',
+    },
+    {
+        'name': 'spynl.log_redact_keys',
+        'plugin': '',
+        'required': 'no',
+        'default': 'password',
+        'info': 'Comma separated list of request arguments whose values are '
+        'masked when requests are logged.',
+    },
+    {
+        'name': 'spynl.log_payload_size',
+        'plugin': '',
+        'required': 'no',
+        'default': '10000',
+        'info': 'The maximum number of characters of the arguments of a '
+        'request that are written when it is logged.',
+    },
     {
         'name': 'spynl.session',
         'plugin': '',
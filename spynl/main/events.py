@@ -3,14 +3,22 @@ Custom handling of requests and responses.
 """
 
 from os.path import basename, splitext
-from copy import deepcopy
 
 from pyramid.events import NewRequest, BeforeTraversal, ContextFound, NewResponse
 from pyramid.httpexceptions import HTTPUnsupportedMediaType
 
-from spynl.main.utils import unify_args, get_logger, is_origin_allowed, validate_locale
+from spynl.main.utils import (
+    find_view_name,
+    known_args,
+    move_sid_to_headers,
+    get_logger,
+    is_origin_allowed,
+    validate_locale,
+    LogPayload,
+)
 from spynl.main.serial.typing import negotiate_request_content_type
 from spynl.main.serial.exceptions import UnsupportedContentTypeException
+from spynl.main.timing import timed
 
 
 def prepare_content_types(event):
@@ -93,21 +101,21 @@ def store_accepted_lang(event):
 
 def parse_args_and_log_request(event):
     """
-    Parse request data when context is known,
-    and log the request (together with parsed arguments) with
+    Prepare request data when context is known,
+    and log the request (together with its arguments) with
     log level INFO.
     Best to do this when the context is known and available
     through the request object, as this can influence how
     we parse request data.
+
+    The arguments themselves (request.args) are only brought together
+    when they are first used, see unify_args.
     """
     request = event.request
-    # bring all args together in the args dict on the request
-    request.args = unify_args(request)
+    request.endpoint_method = find_view_name(request)
+    move_sid_to_headers(request)
     # log the request
     log = get_logger()
-    args = deepcopy(request.args)
-    if 'password' in args:
-        args['password'] = '*********'
     origin = request.headers.get('Origin', '')
     origin_txt = ''
     if origin:
@@ -116,7 +124,10 @@ def parse_args_and_log_request(event):
         'New request for URL path "%s" from %s',
         request.path_url,
         origin_txt,
-        extra=dict(meta=dict(url=request.path_url), payload=args),
+        extra=dict(
+            meta=dict(url=request.path_url),
+            payload=LogPayload(lambda: known_args(request)),
+        ),
     )
 
 
@@ -125,9 +136,11 @@ def enforce_response_type(event):
     Support two exotic types of response data: text and download, which can
     be enforced by arguments.
     In the first case, we set the content type, in the second we set headers.
+    The args are looked at as far as they are known (see known_args), so
+    they are not brought together for this.
     """
     r = event.request
-    args = getattr(r, 'args', {})
+    args = known_args(r)
 
     if 'force_text' in args:
         event.response.content_type = 'text/plain'
@@ -149,9 +162,9 @@ def enforce_response_type(event):
 
 def main(config):
     """Subscribe to pyramid events."""
-    config.add_subscriber(split_extension, NewRequest)
-    config.add_subscriber(store_accepted_lang, NewRequest)
-    config.add_subscriber(prepare_content_types, BeforeTraversal)
-    config.add_subscriber(parse_args_and_log_request, ContextFound)
-    config.add_subscriber(enforce_response_type, NewResponse)
-    config.add_subscriber(corsify_response, NewResponse)
+    config.add_subscriber(timed(split_extension), NewRequest)
+    config.add_subscriber(timed(store_accepted_lang), NewRequest)
+    config.add_subscriber(timed(prepare_content_types), BeforeTraversal)
+    config.add_subscriber(timed(parse_args_and_log_request), ContextFound)
+    config.add_subscriber(timed(enforce_response_type), NewResponse)
+    config.add_subscriber(timed(corsify_response), NewResponse)
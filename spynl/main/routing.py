@@ -122,8 +122,12 @@ def add_endpoint(
     All routes your endpoint should be applied to must be known at
     this point, so if a Spynl plugin adds a new route scheme, include
     (require) it before you add endpoints.
+    With stream_body=True, the request body is not parsed into the args
+    of the request, the endpoint reads it with request.iter_documents (or
+    as it is, from request.body or request.body_file).
     """
     logger = get_logger('spynl.main.routing')
+    stream_body = kw.pop('stream_body', False)
 
     generate_documentation = (
         os.environ.get('GENERATE_SPYNL_DOCUMENTATION') == 'generate'
@@ -146,6 +150,9 @@ def add_endpoint(
             return
         has_method = endpoint_name and endpoint_name != '/'
         match_param = has_method and "method={}".format(endpoint_name) or None
+        if stream_body:
+            streamed = config.get_settings()['spynl.streamed_bodies']
+            streamed.add((context, endpoint_name if has_method else ''))
         for path in context.paths:
             rroutes = config.get_settings()['spynl.resource_routes_info']
             for route_name, rinfo in rroutes.items():
@@ -177,6 +184,8 @@ def add_endpoint(
 
     else:  # This is a general endpoint without route
         logger.debug("Adding endpoint '%s'", endpoint_name)
+        if stream_body:
+            config.get_settings()['spynl.streamed_bodies'].add((None, endpoint_name))
         config.add_view(func, name=endpoint_name, permission=permission, **kw)
         if generate_documentation:
             document_endpoint(config, func, endpoint_name)
@@ -199,5 +208,9 @@ def main(config):
     # Spynl plugins. Our convention is that there is also a route
     # pattern that ends with ".nomethod"
     config.add_settings({'spynl.resource_routes_info': resource_routes_info})
+    # The (resource class, endpoint name) of endpoints that read the
+    # request body themselves, see add_endpoint. The resource class is
+    # None for general endpoints.
+    config.add_settings({'spynl.streamed_bodies': set()})
 
     config.add_directive('add_endpoint', add_endpoint)
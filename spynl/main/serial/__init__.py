@@ -16,11 +16,14 @@ The main utility functions of this module are parse_post_data and renderer,
 they are added to config in main.
 """
 
+from collections.abc import Iterator
 from datetime import datetime
 
 from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.settings import asbool
+from pyramid.threadlocal import manager
 
+from spynl.main.serial import json as spynl_json
 from spynl.main.serial.typing import handlers
 from spynl.main.serial.typing import negotiate_response_content_type
 from spynl.main.serial.exceptions import (
@@ -39,6 +42,7 @@ from spynl.main.serial.objects import (
     encode_spynl_translation_string,
 )
 from spynl.main.locale import SpynlTranslationString
+from spynl.main.utils import get_logger
 
 
 def parse_post_data(request):
@@ -56,6 +60,29 @@ def parse_post_data(request):
     return parsed_body
 
 
+def iter_documents(request):
+    """
+    Return an iterator over the documents under 'data' in the request body.
+
+    Content types with an 'iterload' function (JSON, CSV and XML) are read
+    and decoded one document at a time, so endpoints which import large
+    amounts of documents (see the stream_body option of add_endpoint) can
+    do so in bounded memory. Other content types are parsed as a whole
+    first.
+    """
+    context = None
+    if hasattr(request, 'context') and request.context:
+        context = request.context
+    iterload = handlers.get(request.content_type, {}).get('iterload')
+    if iterload:
+        return iterload(request.body_file, headers=request.headers, context=context)
+    try:
+        body = loads(request.text, request.content_type, request.headers, context)
+    except MalformedRequestException as e:
+        raise HTTPBadRequest(detail=e.message.translate(request.localizer))
+    return iter(body.get('data') or ())
+
+
 def renderer(values, system):
     """
     Render data which the view created as a response.
@@ -64,6 +91,14 @@ def renderer(values, system):
     this module renders in the content type set on the request
     (see parse_post_data).
     If spynl.pretty is set, formatting (pretty-printing) is done.
+
+    A view can return an iterator (e.g. a generator or a database cursor)
+    under 'data'. If the content type supports it, the response is then
+    streamed: the documents are encoded while the response is being sent.
+    Otherwise the iterator is read into a list first. Content types which
+    set 'always_stream' (e.g. CSV) also stream lists.
+    A list under 'data' is first passed to the 'prepare' function of the
+    content type, if it has one (e.g. to encode dates in bulk).
     """
     r = system['request']
     if not isinstance(system['context'], Exception):
@@ -73,6 +108,23 @@ def renderer(values, system):
         values['status'] = 'ok'
 
     pretty = asbool(r.registry.settings.get('spynl.pretty'))
+    data = values.get('data') if isinstance(values, dict) else None
+    if data:
+        handler = handlers.get(r.response.content_type, {})
+        if isinstance(data, list) and 'prepare' in handler:
+            values['data'] = data = handler['prepare'](data)
+        lazy = isinstance(data, Iterator)
+        if 'stream' in handler and (lazy or handler.get('always_stream')):
+            charset = r.response.charset or 'UTF-8'
+            chunks = handler['stream'](values, pretty=pretty)
+            stream = ResponseStream(chunks, r, charset)
+            # the first chunk (e.g. the CSV header and first rows) is made
+            # now, so that errors in it still get to the error views
+            stream.prime()
+            return stream
+        if lazy:
+            values['data'] = list(data)
+
     try:
         response = dumps(values, r.response.content_type, pretty=pretty)
     except UnsupportedContentTypeException:
@@ -81,6 +133,52 @@ def renderer(values, system):
     return response
 
 
+class ResponseStream(object):
+    """
+    The app_iter of a streamed response, encoding the chunks of a stream
+    function to bytes.
+
+    The WSGI server consumes the app_iter after Pyramid has popped the
+    threadlocals of the request, which the encode functions rely on, so
+    they are pushed again while each chunk is produced.
+    Because the status and headers are sent before the data is encoded, an
+    error during streaming can only abort the response. That is why the
+    renderer makes the first chunk before the response is sent (see prime).
+    """
+
+    def __init__(self, chunks, request, charset='UTF-8'):
+        self.chunks = chunks
+        self.request = request
+        self.charset = charset
+        self.first = None
+
+    def prime(self):
+        """Make the first chunk now, while the request is being handled."""
+        try:
+            self.first = next(self.chunks).encode(self.charset)
+        except StopIteration:
+            self.first = b''
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.first is not None:
+            chunk, self.first = self.first, None
+            return chunk
+        manager.push({'request': self.request, 'registry': self.request.registry})
+        try:
+            return next(self.chunks).encode(self.charset)
+        finally:
+            manager.pop()
+
+    def close(self):
+        """Called by the WSGI server, also if the client went away."""
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+
 # ---- high-level dumps and loads functions,
 #      relay to specific dumps and loads per type
 
@@ -127,6 +225,14 @@ def main(config):
     config.add_settings(
         {'spynl.renderer': renderer, 'spynl.post_parser': parse_post_data}
     )
+    config.add_request_method(iter_documents, reify=True)
+    if (
+        config.get_settings().get('spynl.json_backend') == 'orjson'
+        and spynl_json.orjson is None
+    ):
+        get_logger('spynl.main.serial').warning(
+            'spynl.json_backend is orjson, but orjson is not installed.'
+        )
     # define decode function for date fields:
     add_decode_function(config, decode_date, ['date'])
     # define encoding functions
@@ -8,21 +8,26 @@ list of documents with the same structure and no nested documents.
 
 import csv
 import io
+import itertools
+import time
+from collections.abc import Iterator
+from json.encoder import encode_basestring, INFINITY
 
 from spynl.main.serial import objects
 from spynl.main.serial import json as spynl_json
 from spynl.main.serial.exceptions import MalformedRequestException
+from spynl.main.utils import get_logger
 
 
-def loads(body, headers=None, context=None):
+# the dialect is sniffed from the first this many characters
+SNIFF_SIZE = 3000
+
+
+def sniff_dialect(sample, headers=None):
     """
-    Parse CSV input. Header fields can contain delimiter and quotechar info.
-    Search queries need to remain powerful in structure, so we test for JSON
-    first (this can go later, when SWPY-295 is done).
+    Return the delimiter and quotechar, from the x-spynl headers or sniffed
+    from a sample of the CSV.
     """
-    if spynl_json.sniff(body):
-        return spynl_json.loads(body)
-
     # check x-spynl headers
     headers = {} if headers is None else headers
     delimiter = headers.get('x-spynl-delimiter')
@@ -30,86 +35,190 @@ def loads(body, headers=None, context=None):
     # if not given, sniff delimiter and quotechar
     if not delimiter or not quotechar:
         try:
-            dialect = csv.Sniffer().sniff(body[:3000])
+            try:
+                dialect = csv.Sniffer().sniff(sample[:SNIFF_SIZE])
+            except csv.Error as err:
+                if str(err) != 'Could not determine delimiter':
+                    raise
+                dialect = csv.Sniffer().sniff(
+                    sample[: 2 * SNIFF_SIZE], delimiters=',\t|'
+                )
         except Exception as err:
-            if str(err) == 'Could not determine delimiter':
-                dialect = csv.Sniffer().sniff(body[:6000], delimiters=',\t|')
-            else:
-                raise MalformedRequestException('text/csv', error_cause=str(err))
+            raise MalformedRequestException('text/csv', error_cause=str(err))
 
         if not delimiter:
             delimiter = dialect.delimiter
         if not quotechar:
             quotechar = dialect.quotechar
 
-    data = body.split("\n")
-    dict_data = [
-        objects.SpynlDecoder(context=context)(dic)
-        for dic in csv.DictReader(data, delimiter=delimiter, quotechar=quotechar)
-    ]
-
-    return {'data': dict_data}
+    return delimiter, quotechar
 
 
-class CSVString:
-    """Very simple Dummy class to create a CSV String."""
+def read_rows(lines, sample, headers=None, context=None):
+    """
+    Yield the rows of CSV as decoded dictionaries, one by one.
 
-    def __init__(self):
-        self.data = ''
+    lines is an iterable of lines which keep their line endings (e.g. a file
+    opened with newline=''), so quoted fields can contain newlines. The
+    dialect is sniffed from sample, the start of the CSV.
+    """
+    log = get_logger('spynl.main.serial')
+    delimiter, quotechar = sniff_dialect(sample, headers)
+    decoder = objects.get_decoder(context=context)
+    reader = csv.DictReader(lines, delimiter=delimiter, quotechar=quotechar)
+    rows = 0
+    start = time.perf_counter()
+    try:
+        for row in reader:
+            rows += 1
+            yield decoder(row)
+    except (csv.Error, UnicodeDecodeError) as err:
+        raise MalformedRequestException('text/csv', error_cause=str(err))
+
+    seconds = time.perf_counter() - start
+    log.info(
+        'Read %d CSV rows in %.3fs (%d rows/s).',
+        rows,
+        seconds,
+        rows / seconds if seconds else 0,
+    )
 
-    def __str__(self):
-        return self.data
 
-    def write(self, s):
-        """Only needed method for use in CSVWriter."""
-        self.data += s
+def loads(body, headers=None, context=None):
+    """
+    Parse CSV input. Header fields can contain delimiter and quotechar info.
+    Search queries need to remain powerful in structure, so we test for JSON
+    first (this can go later, when SWPY-295 is done).
+    """
+    if spynl_json.sniff(body):
+        return spynl_json.loads(body)
 
+    lines = io.StringIO(body, newline='')
+    return {'data': list(read_rows(lines, body, headers, context))}
 
-class UnicodeStringCSVWriter:
-    """A CSV writer to write rows to a string, which is encoded in UTF-8."""
 
-    def __init__(self, dialect=csv.excel, **kwds):
-        # Redirect output to a queue
-        self.output = io.StringIO()
-        self.writer = csv.writer(self.output, dialect=dialect, **kwds)
+class TextBytes(object):
+    """
+    A binary file of text read so far (head) and a text file with the rest,
+    encoded to UTF-8 again while it is read.
+    """
 
-    def writerow(self, row):
-        """Write a row."""
-        self.writer.writerow([str(s) for s in row])
+    def __init__(self, head, text):
+        self.head = io.BytesIO(head.encode('utf-8'))
+        self.text = text
 
-    def release(self):
-        """Fetch the UTF-8 output from the `output` and decode it."""
-        data = self.output.getvalue()
-        self.output.truncate(0)  # empty queue
-        return data
+    def read(self, size=-1):
+        """Read about size bytes, of the head until it is read, then of the rest."""
+        return self.head.read(size) or self.text.read(size).encode('utf-8')
 
-    def writerows(self, rows):
-        """Write rows."""
-        for row in rows:
-            self.writerow(row)
 
+def iterloads(stream, headers=None, context=None):
+    """
+    Yield the rows of CSV read from stream (a binary file, e.g.
+    request.body_file) as decoded dictionaries, one by one.
 
-def dumps(body, pretty=False):  # pylint: disable=unused-argument
+    Only the start of the CSV is read up front, to sniff the dialect, so
+    large uploads are read in bounded memory. An empty body has no rows.
+    A JSON body is streamed as well, see json.iterloads.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    try:
+        try:
+            sample = text.read(2 * SNIFF_SIZE)
+            if not sample.strip():
+                return
+            if spynl_json.sniff(sample):
+                yield from spynl_json.iterloads(
+                    TextBytes(sample, text), context=context
+                )
+                return
+            # complete the last line of the sample, the reader continues after it
+            sample += text.readline()
+        except UnicodeDecodeError as err:
+            raise MalformedRequestException('text/csv', error_cause=str(err))
+
+        lines = itertools.chain(io.StringIO(sample, newline=''), text)
+        yield from read_rows(lines, sample, headers, context)
+    finally:
+        # leave the stream open for whoever else reads it
+        text.detach()
+
+
+# streamed output is yielded after this many rows
+CHUNK_ROWS = 1000
+
+MISSING_CELL = encode_basestring(' ')
+
+
+def encode_float(value):
+    """Encode a float like JSON does (NaN and infinity as the standard encoder)."""
+    if value != value or value in (INFINITY, -INFINITY):
+        return spynl_json.get_encoder().encode(value)
+    return float.__repr__(value)
+
+
+# Scalars are encoded here like JSON would, other values go through JSON.
+CELL_ENCODERS = {
+    str: encode_basestring,
+    int: int.__repr__,
+    float: encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+
+
+def encode_cell(value):
+    """Encode a value for a CSV cell, as its JSON representation."""
+    encoder = CELL_ENCODERS.get(value.__class__)
+    if encoder is None:
+        return spynl_json.dumps(value)
+    return encoder(value)
+
+
+def iterdumps(body, pretty=False):
     """
-    Dump the passed body into JSON.
+    Yield the passed body as CSV, in chunks of rows.
 
     CSV is a flat format, and eveything nested will be send as a
     quoted dumped JSON string. This is also why all other strings
     will be quoted.
     All content should be contained in a dictionary,
-    in a list under the single key "data".
+    in a list (or any other iterable) under the single key "data".
+    The keys of the first document are used as columns.
     If there is no "data" key, we render the whole response as JSON.
     """
-    if body.get('data'):
-        csv_writer = UnicodeStringCSVWriter(quoting=csv.QUOTE_MINIMAL, quotechar="'")
-        json_data = body.get('data')
-        keys = list(json_data[0].keys())
-        csv_writer.writerow(keys)
-        for doc in json_data:
-            row = [spynl_json.dumps(doc.get(k, ' ')) for k in keys]
-            csv_writer.writerow(row)
-        return csv_writer.release()
-    return spynl_json.dumps(body, pretty)
+    documents = iter(body.get('data') or ())
+    try:
+        first = next(documents)
+    except StopIteration:
+        if isinstance(body.get('data'), Iterator):
+            body = dict(body, data=[])
+        yield spynl_json.dumps(body, pretty)
+        return
+
+    output = io.StringIO()
+    writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL, quotechar="'")
+    keys = list(first.keys())
+    writer.writerow(keys)
+    rows = 1
+    for doc in itertools.chain([first], documents):
+        writer.writerow(
+            [encode_cell(doc[k]) if k in doc else MISSING_CELL for k in keys]
+        )
+        rows += 1
+        if rows == CHUNK_ROWS:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+            rows = 0
+
+    if rows:
+        yield output.getvalue()
+
+
+def dumps(body, pretty=False):
+    """Dump the passed body into CSV, see iterdumps."""
+    return ''.join(iterdumps(body, pretty))
 
 
 def sniff(body):
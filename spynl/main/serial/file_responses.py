@@ -1,14 +1,70 @@
 import csv
+import itertools
+import os
 from io import StringIO
+from operator import itemgetter
 from tempfile import NamedTemporaryFile
 
 from openpyxl import Workbook
 from pyramid.response import FileIter
 
 
+class ColumnPlan:
+    """
+    The columns of an export, worked out once.
+
+    If a reference is given, the columns are ordered as they are found in
+    it. Rows are projected onto the columns with an itemgetter; rows which
+    lack some of the columns get the missing value there.
+    """
+
+    def __init__(self, columns, reference=None, missing=None):
+        columns = list(columns)
+        if reference is not None:
+            positions = {}
+            for position, key in enumerate(reference):
+                positions.setdefault(key, position)
+            try:
+                columns.sort(key=positions.__getitem__)
+            except KeyError as err:
+                raise ValueError('{} is not in the reference'.format(err))
+
+        self.header = columns
+        self.missing = missing
+        self._single = len(columns) == 1
+        self._getter = itemgetter(*columns) if columns else lambda row: ()
+
+    def project(self, row):
+        """Return the values of row as a list, ordered as the header."""
+        try:
+            values = self._getter(row)
+        except KeyError:
+            return [row.get(key, self.missing) for key in self.header]
+        return [values] if self._single else list(values)
+
+    def rows(self, data):
+        """Yield the projected rows of data, which can be any iterable."""
+        project = self.project
+        for row in data:
+            yield project(row)
+
+
+def plan_export(data, reference=None):
+    """
+    Return a ColumnPlan for the keys of the first row of data, and the data
+    as an iterator that still starts with that row.
+    """
+    data = iter(data)
+    try:
+        first = next(data)
+    except StopIteration:
+        return ColumnPlan([], reference), data
+    return ColumnPlan(first, reference), itertools.chain([first], data)
+
+
 def export_header(data, reference):
     """Return the column names ordered as they are found in the reference."""
-    return sorted(data[0], key=lambda i: reference.index(i))
+    return ColumnPlan(data[0], reference).header
 
 
 def export_data(data, header):
@@ -17,17 +73,24 @@ def export_data(data, header):
 
     The inner lists are ordered according the header.
     """
-    return [[row[k] for k in header] for row in data]
+    return list(ColumnPlan(header).rows(data))
 
 
 def export_excel(header, data):
-    """Export the data as an excel attachment."""
+    """
+    Export the data as an excel attachment.
+
+    header is a list of column names or a ColumnPlan, data can be any
+    iterable of dictionaries. The workbook is write-only, so rows are
+    written to disk as they come and never kept in memory.
+    """
+    plan = header if isinstance(header, ColumnPlan) else ColumnPlan(header)
     tmp = NamedTemporaryFile()
-    wb = Workbook()
-    ws = wb.active
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
 
-    ws.append(header)
-    for row in export_data(data, header):
+    ws.append(plan.header)
+    for row in plan.rows(data):
         ws.append(row)
 
     wb.save(tmp.name)
@@ -41,16 +104,24 @@ def serve_excel_response(response, file, filename):
     response.content_type = (
         'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
+    # setting app_iter resets the content length, so it goes first
     response.app_iter = FileIter(file)
+    response.content_length = os.fstat(file.fileno()).st_size
     return response
 
 
 def export_csv(header, data):
-    """Export the data as csv as a string."""
+    """
+    Export the data as csv as a string.
+
+    header is a list of column names or a ColumnPlan, data can be any
+    iterable of dictionaries.
+    """
+    plan = header if isinstance(header, ColumnPlan) else ColumnPlan(header)
     with StringIO() as tmp:
-        writer = csv.DictWriter(tmp, fieldnames=header)
-        writer.writeheader()
-        writer.writerows(data)
+        writer = csv.writer(tmp)
+        writer.writerow(plan.header)
+        writer.writerows(plan.rows(data))
         data = tmp.getvalue()
 
     return data
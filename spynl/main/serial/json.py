@@ -1,37 +1,309 @@
 """Handle JSON content."""
 
 from decimal import Decimal
+import codecs
 import json
 import re
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 from spynl.main.serial import objects
 from spynl.main.serial.exceptions import MalformedRequestException
+from spynl.main.utils import get_settings
+
+
+# streamed output is yielded in chunks of about this many characters
+CHUNK_SIZE = 64 * 1024
+
+EXPRESSION = re.compile(r'^\s*\{')
+
+# datetimes, dataclasses and subclasses of builtin types are encoded by the
+# encode functions, as with json
+OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+    | orjson.OPT_PASSTHROUGH_SUBCLASS
+    | orjson.OPT_NON_STR_KEYS
+    if orjson is not None
+    else 0
+)
+
+# subclasses of these are passed to the default function by orjson
+PASSTHROUGH_TYPES = (str, int, dict, list)
+
+
+class SpynlJSONEncoder(json.JSONEncoder):
+    """
+    JSONEncoder which encodes objects JSON does not know about with the
+    functions in the EncodeTable. Decimals and sets are handled here.
+    """
+
+    def __init__(self, table, **kwargs):
+        super().__init__(**kwargs)
+        self.table = table
+        self.dispatch = {}
+
+    def resolve(self, cls):
+        """Return the function to make objects of type cls JSON-ready."""
+        if issubclass(cls, Decimal):
+            function = float
+        elif issubclass(cls, set):
+            function = list
+        else:
+            function = self.table.encode
+        self.dispatch[cls] = function
+        return function
+
+    def default(self, obj):  # pylint: disable=method-hidden
+        function = self.dispatch.get(obj.__class__)
+        if function is None:
+            function = self.resolve(obj.__class__)
+        return function(obj)
+
+
+def get_encoder(pretty=False):
+    """Return the (cached) encoder for the current encode functions."""
+    # encoders are kept on the table, so they go when the table is replaced
+    table = objects.get_encode_table()
+    try:
+        return table.json_encoders[pretty]
+    except KeyError:
+        indent = 4 if pretty else None
+        encoder = SpynlJSONEncoder(table, indent=indent, ensure_ascii=False)
+        table.json_encoders[pretty] = encoder
+        return encoder
+
+
+def use_orjson():
+    """Return if orjson is configured as backend (spynl.json_backend) and found."""
+    return orjson is not None and get_settings().get('spynl.json_backend') == 'orjson'
+
+
+def orjson_dumps(body):
+    """
+    Return JSON body as string, encoded by orjson.
+
+    Types orjson does not know about (including datetimes) go through the
+    default method of the standard encoder, so they are encoded the same.
+    Anything orjson cannot do (e.g. integers over 64 bits) is left to the
+    standard encoder, as are bodies with subclasses of builtin types, which
+    json writes as their base type.
+
+    Unlike json, orjson writes NaN and infinity as null, enums as their
+    value and UUIDs itself.
+    """
+    encoder = get_encoder()
+
+    def default(obj):
+        if isinstance(obj, PASSTHROUGH_TYPES):
+            raise TypeError('left to json')
+        return encoder.default(obj)
+
+    try:
+        return orjson.dumps(body, default=default, option=OPTIONS).decode('utf-8')
+    except orjson.JSONEncodeError:
+        return encoder.encode(body)
+
+
+def get_dump(pretty=False):
+    """
+    Return the function to dump with. orjson is only used for compact output,
+    as it cannot indent with four spaces.
+    """
+    if not pretty and use_orjson():
+        return orjson_dumps
+    return get_encoder(pretty).encode
 
 
 def loads(body, context=None, **kwargs):
     """Return body as JSON."""
+    # JSON strings are never bytes, so the decoder can skip that check
+    decoder = objects.get_decoder(context, decode_bytes=False)
+    if use_orjson():
+        try:
+            return decoder.decode(orjson.loads(body))
+        except orjson.JSONDecodeError:
+            # the standard parser is more lenient (e.g. NaN, big integers)
+            pass
     try:
-        decoder = objects.SpynlDecoder(context)
+        if not decoder.fields:
+            return json.loads(body)
         return json.loads(body, object_hook=decoder)
     except ValueError as err:
         raise MalformedRequestException('application/json', error_cause=str(err))
 
 
+class StreamReader(object):
+    """
+    Read JSON values one by one from a binary stream, keeping only a small
+    part of it in memory.
+    """
+
+    whitespace = re.compile(r'\s*')
+    number_tail = re.compile(r'[0-9.eE+-]*$')
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk, return False if the stream was at its end."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos :] + self.decode(chunk, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """Skip whitespace and return the next character, '' at the end."""
+        while True:
+            self.pos = self.whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next character, which should be one of chars."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(
+                'Expecting {}: char {}'.format(' or '.join(map(repr, chars)), self.pos)
+            )
+        self.pos += 1
+        return char
+
+    def value(self, decoder):
+        """Return the next JSON value, decoded with decoder."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            # a number at the end of the buffer might continue in the next chunk
+            if self.number_tail.match(self.buffer, end) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self, decoder):
+        """Yield the values of the next JSON array one by one."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value(decoder)
+            if self.expect(',]') == ']':
+                return
+
+
+def iterloads(stream, context=None, chunk_size=CHUNK_SIZE, **kwargs):
+    """
+    Yield the documents under 'data' in a JSON object read from stream (a
+    binary file, e.g. request.body_file), one at a time.
+
+    Documents are decoded one by one, so the body is never in memory as a
+    whole. Other keys of the object are parsed, but not kept. The standard
+    library is used, whatever the JSON backend is.
+    """
+    decoder = objects.get_decoder(context, decode_bytes=False)
+    documents = json.JSONDecoder(object_hook=decoder if decoder.fields else None)
+    reader = StreamReader(stream, chunk_size)
+    try:
+        if not reader.peek():
+            return
+        reader.expect('{')
+        if reader.peek() == '}':
+            reader.pos += 1
+        else:
+            while True:
+                if reader.peek() != '"':
+                    raise ValueError(
+                        'Expecting property name: char {}'.format(reader.pos)
+                    )
+                key = reader.value(documents)
+                reader.expect(':')
+                if key == 'data':
+                    yield from reader.array(documents)
+                else:
+                    reader.value(documents)
+                if reader.expect(',}') == '}':
+                    break
+        if reader.peek():
+            raise ValueError('Extra data: char {}'.format(reader.pos))
+    except ValueError as err:
+        raise MalformedRequestException('application/json', error_cause=str(err))
+
+
 def dumps(body, pretty=False):
     """Return JSON body as string."""
-    indent = 4 if pretty else None
+    return get_dump(pretty)(body)
+
 
-    class JSONEncoder(json.JSONEncoder):
-        """Custom JSONEncoder to encode the object."""
+def iterdumps(body, pretty=False):
+    """
+    Yield JSON body as strings, encoding the items under 'data' one by one.
+
+    'data' can be any iterable, e.g. a generator or a database cursor. It is
+    written as the last key of the object, after the rest of the body.
+    """
+    dump = get_dump(pretty)
+    envelope = {key: value for key, value in body.items() if key != 'data'}
+    head = dump(envelope)
+    if pretty:
+        indent = '\n' + ' ' * 8
+        separator = ','
+        head = head[:-2] + ',\n    ' if envelope else '{\n    '
+        tail = '\n    ]\n}'
+        empty_tail = ']\n}'
+        key = '"data": ['
+    elif dump is orjson_dumps:
+        # orjson writes without spaces
+        indent = ''
+        separator = ','
+        head = head[:-1] + ',' if envelope else '{'
+        tail = empty_tail = ']}'
+        key = '"data":['
+    else:
+        indent = ''
+        separator = ', '
+        head = head[:-1] + ', ' if envelope else '{'
+        tail = empty_tail = ']}'
+        key = '"data": ['
 
-        def default(self, obj):  # pylint: disable=method-hidden
-            if isinstance(obj, Decimal):
-                return float(obj)
-            if isinstance(obj, set):
-                return list(obj)
-            return objects.encode(obj)
+    chunk = [head, key]
+    size = 0
+    first = True
+    for item in body.get('data') or ():
+        text = dump(item)
+        if indent:
+            # JSON strings cannot contain raw newlines, so this is safe
+            text = indent + text.replace('\n', indent)
+        if not first:
+            chunk.append(separator)
+        chunk.append(text)
+        first = False
+        size += len(text)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
 
-    return json.dumps(body, indent=indent, ensure_ascii=False, cls=JSONEncoder)
+    chunk.append(empty_tail if first else tail)
+    yield ''.join(chunk)
 
 
 def sniff(body):
@@ -40,5 +312,4 @@ def sniff(body):
 
     Body should start with any amount of whitespace and a {.
     """
-    expression = re.compile(r'^\s*\{')
-    return bool(re.match(expression, body))
+    return bool(re.match(EXPRESSION, body))
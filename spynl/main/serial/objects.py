@@ -4,12 +4,19 @@ Here, we do text/unicode(utf-8) conversions.
 Furthermore, we apply (de)serialisation which plugins can define for object
 types like IDs or dates.
 """
+from collections import Counter
+from datetime import datetime
+import threading
+
 from pyramid import threadlocal
+from pyramid.settings import asbool
+from pytz import utc
+
 from spynl.main.dateutils import (
     date_format_str,
     localize_date,
-    date_to_str,
     date_from_str,
+    get_date_context,
 )
 from spynl.main.utils import get_settings, get_logger
 from spynl.main.locale import SpynlTranslationString as _
@@ -20,11 +27,22 @@ class SpynlDecoder(object):
     (Incoming) Decodes Python objects from strings.
     It provides a function that routes to custom
     decoders for certain fields.
+
+    The decode functions are looked up once, when the decoder is made, so
+    one decoder can be used for a whole request (see get_decoder).
     """
 
-    def __init__(self, context=None):
-        """Enable the decoding functions to be context-aware."""
+    def __init__(self, context=None, decode_bytes=True):
+        """
+        Enable the decoding functions to be context-aware.
+
+        decode_bytes can be switched off for input which cannot contain
+        bytes, like JSON.
+        """
         self.context = context
+        self.decode_bytes = decode_bytes
+        self.decode_functions = get_settings().get('serial_decode_functions', {})
+        self.fields = frozenset(self.decode_functions)
 
     def __call__(self, dic):
         """
@@ -38,38 +56,161 @@ class SpynlDecoder(object):
         so they change the dic and not a copy.
         They also get the context of the request.
         """
-        settings = get_settings()
-        decode_functions = settings.get('serial_decode_functions', {})
-        for fieldname in dic:
-            if fieldname in decode_functions:
-                decode_functions[fieldname](
+        if self.fields:
+            for fieldname in dic.keys() & self.fields:
+                self.decode_functions[fieldname](
                     dic, fieldname=fieldname, context=self.context
                 )
 
-        # All remaining strings: we use unicode internally
-        # & we expect incoming strings to be UTF-8 encoded
-        for k in dic:
-            if isinstance(dic[k], bytes):
-                dic[k] = str(dic[k], errors='strict', encoding='utf-8')
+        if self.decode_bytes:
+            # All remaining strings: we use unicode internally
+            # & we expect incoming strings to be UTF-8 encoded
+            for k, value in dic.items():
+                if isinstance(value, bytes):
+                    dic[k] = str(value, errors='strict', encoding='utf-8')
 
         return dic
 
+    def decode(self, value):
+        """
+        Decode all dictionaries in a structure of dicts and lists, innermost
+        first, like json.loads does with this decoder as object_hook.
+        """
+        if not self.fields and not self.decode_bytes:
+            return value
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, (dict, list)):
+                    value[key] = self.decode(item)
+            return self(value)
+        if isinstance(value, list):
+            for index, item in enumerate(value):
+                if isinstance(item, (dict, list)):
+                    value[index] = self.decode(item)
+        return value
+
+
+def get_decoder(context=None, decode_bytes=True):
+    """
+    Return a SpynlDecoder for context, which is made once per request and
+    reused by everything that decodes input during that request.
+    """
+    request = threadlocal.get_current_request()
+    if request is None:
+        return SpynlDecoder(context, decode_bytes)
+
+    decoders = vars(request).setdefault('spynl_decoders', {})
+    decoder = decoders.get(decode_bytes)
+    if decoder is None or decoder.context is not context:
+        decoder = decoders[decode_bytes] = SpynlDecoder(context, decode_bytes)
+    return decoder
+
+
+class EncodeTable(object):
+    """
+    The compiled form of the serial_encode_functions dictionary.
+
+    The encode function for a type is resolved once, by walking the MRO of
+    that type, after which it is looked up by exact type. A new table is
+    built whenever add_encode_function is called.
+    """
+
+    def __init__(self, encode_functions):
+        self.encode_functions = dict(encode_functions)
+        self.dispatch = {}
+        # the JSON encoders using this table, see serial.json.get_encoder
+        self.json_encoders = {}
+
+    def lookup(self, cls):
+        """Return the encode function for objects of type cls, or None."""
+        try:
+            return self.dispatch[cls]
+        except KeyError:
+            pass
+
+        function = None
+        for base in cls.__mro__:
+            if base in self.encode_functions:
+                function = self.encode_functions[base]
+                break
+        else:
+            # abstract base classes can claim types outside of the MRO
+            for obj_type, obj_function in self.encode_functions.items():
+                if issubclass(cls, obj_type):
+                    function = obj_function
+                    break
+
+        self.dispatch[cls] = function
+        return function
+
+    def encode(self, obj):
+        """Encode obj with the function registered for its type."""
+        function = self.lookup(type(obj))
+        if function is not None:
+            obj = function(obj)
+        return str(obj)
+
+
+class CountingEncodeTable(EncodeTable):
+    """
+    An EncodeTable which counts how often the function for a type was found
+    in the dispatch cache, used if spynl.timing is set (see encode_stats).
+    Requests run in threads, so the counts are updated under a lock.
+    """
+
+    def __init__(self, encode_functions):
+        super().__init__(encode_functions)
+        self.hits = Counter()
+        self.lock = threading.Lock()
+
+    def lookup(self, cls):
+        if cls in self.dispatch:
+            with self.lock:
+                self.hits[cls] += 1
+        return super().lookup(cls)
+
+
+def make_encode_table(encode_functions, settings):
+    """Return an EncodeTable, which counts hits if spynl.timing is set."""
+    if asbool(settings.get('spynl.timing', False)):
+        return CountingEncodeTable(encode_functions)
+    return EncodeTable(encode_functions)
+
+
+def get_encode_table():
+    """Return the EncodeTable of the current registry."""
+    settings = get_settings()
+    table = settings.get('serial_encode_table')
+    if table is None:
+        table = make_encode_table(settings.get('serial_encode_functions', {}), settings)
+    return table
+
 
 def encode(obj):
     """
     (Outgoing) Encodes a Python object to str.
 
     In serial_encode_functions, functions are defined for specific object
-    types. We use those specific functions to encode those types.
+    types. We use the function for the most specific type of obj to encode
+    it, see EncodeTable.
     """
-    # type specific casting:
-    settings = get_settings()
-    encode_functions = settings.get('serial_encode_functions', {})
-    for obj_type in encode_functions:
-        if isinstance(obj, obj_type):
-            obj = encode_functions[obj_type](obj)
+    return get_encode_table().encode(obj)
+
 
-    return str(obj)
+def encode_stats():
+    """
+    Return the dispatch cache hits of the current EncodeTable per type,
+    which are only counted if spynl.timing is set.
+    """
+    table = get_encode_table()
+    if not isinstance(table, CountingEncodeTable):
+        return {}
+    with table.lock:
+        hits = dict(table.hits)
+    return {
+        '{}.{}'.format(cls.__module__, cls.__qualname__): count
+        for cls, count in hits.items()
+    }
 
 
 def add_decode_function(config, function, fields):
@@ -107,7 +248,10 @@ def add_encode_function(config, function, obj_type):
         log.warning('You are replacing the encoding function for type %s', obj_type)
     encode_functions[obj_type] = function
     # line below needed if setting was not initialised before
-    config.add_settings(serial_encode_functions=encode_functions)
+    config.add_settings(
+        serial_encode_functions=encode_functions,
+        serial_encode_table=make_encode_table(encode_functions, settings),
+    )
 
 
 def decode_date(dic, fieldname, context):
@@ -134,7 +278,56 @@ def encode_boolean(obj):
 
 def encode_date(obj):
     """localize the date and make it a string"""
-    return date_to_str(localize_date(obj))
+    context = get_date_context()
+    return context.to_str(context.localize(obj))
+
+
+def encode_date_columns(documents):
+    """
+    Encode the datetimes in the top-level fields of a list of documents in
+    bulk, before the list is dumped.
+
+    The fields are those that hold a datetime in the first document. Their
+    distinct values are collected column by column, then localised and
+    formatted in one go with the date context resolved once. Documents are
+    copied before their dates are replaced, the list itself is not changed.
+    This is only done if datetimes are encoded with encode_date, anything
+    left is encoded as usual.
+    """
+    if not documents or not isinstance(documents[0], dict):
+        return documents
+    if get_encode_table().lookup(datetime) is not encode_date:
+        return documents
+    columns = [key for key, value in documents[0].items() if type(value) is datetime]
+    if not columns:
+        return documents
+
+    dates = set()
+    for key in columns:
+        for doc in documents:
+            if isinstance(doc, dict) and type(doc.get(key)) is datetime:
+                dates.add(doc[key])
+
+    context = get_date_context()
+    tz, date_format = context.user_tz, context.format
+    encoded = {}
+    for when in dates:
+        localized = when if when.tzinfo else when.replace(tzinfo=utc)
+        encoded[when] = localized.astimezone(tz).strftime(date_format)
+
+    result = []
+    for doc in documents:
+        if isinstance(doc, dict):
+            copied = False
+            for key in columns:
+                value = doc.get(key)
+                if type(value) is datetime:
+                    if not copied:
+                        doc = dict(doc)
+                        copied = True
+                    doc[key] = encoded[value]
+        result.append(doc)
+    return result
 
 
 def encode_spynl_translation_string(obj):
@@ -1,23 +1,158 @@
 """
 Deal with content types in a generic way. Negotiate incoming content types.
 """
-from mimetypes import guess_type
+from functools import lru_cache
+from os.path import splitext
+import mimetypes
+import re
 
 from spynl.main.serial import xml, json, py, html, yaml, csv
+from spynl.main.serial.objects import encode_date_columns
 from spynl.main.serial.exceptions import UndeterminedContentTypeException
 from spynl.main.serial.exceptions import UnsupportedContentTypeException
 
 
 handlers = {
-    'application/json': {'dump': json.dumps, 'load': json.loads, 'sniff': json.sniff},
-    'application/xml': {'dump': xml.dumps, 'load': xml.loads, 'sniff': xml.sniff},
+    'application/json': {
+        'dump': json.dumps,
+        'prepare': encode_date_columns,
+        'stream': json.iterdumps,
+        'load': json.loads,
+        'iterload': json.iterloads,
+        'sniff': json.sniff,
+    },
+    'application/xml': {
+        'dump': xml.dumps,
+        'prepare': encode_date_columns,
+        'stream': xml.iterdumps,
+        'load': xml.loads,
+        'iterload': xml.iterloads,
+        'sniff': xml.sniff,
+    },
     'application/x-yaml': {'dump': yaml.dumps, 'load': yaml.loads, 'sniff': yaml.sniff},
-    'text/csv': {'dump': csv.dumps, 'load': csv.loads, 'sniff': csv.sniff},
+    'text/csv': {
+        'dump': csv.dumps,
+        'prepare': encode_date_columns,
+        'stream': csv.iterdumps,
+        'always_stream': True,
+        'load': csv.loads,
+        'iterload': csv.iterloads,
+        'sniff': csv.sniff,
+    },
     'text/html': {'dump': html.dumps},
     'text/x-python': {'dump': py.dumps},
 }
 handlers['text/xml'] = handlers['application/xml']
 
+# Accept types which say nothing about what the client wants (browsers send
+# text/html first), so we keep our own default
+GENERAL_TYPES = ('text/html', '*/*')
+
+# the sniff functions of the handlers above as one expression, run over the
+# raw body: the types which can be sniffed start with different characters
+SNIFFED_TYPES = ('application/json', 'application/xml', 'application/x-yaml')
+BUILTIN_SNIFFS = (json.sniff, xml.sniff, yaml.sniff, csv.sniff)
+SNIFF_EXPRESSION = re.compile(
+    '|'.join(
+        '({})'.format(module.EXPRESSION.pattern) for module in (json, xml, yaml)
+    ).encode('ascii')
+)
+
+
+def _extension_types():
+    """
+    Return the content types of file extensions (e.g. '.csv', in lower
+    case), as mimetypes.guess_type finds them.
+    """
+    if not mimetypes.inited:
+        mimetypes.init()
+    types = {}
+    for extension, content_type in mimetypes.types_map.items():
+        types.setdefault(extension.lower(), content_type)
+    for suffix, target in mimetypes.suffix_map.items():
+        base, encoding = splitext(target)
+        if encoding in mimetypes.encodings_map and base in types:
+            types[suffix] = types[base]
+    # a compressed file has no type of its own
+    for encoding in mimetypes.encodings_map:
+        types.pop(encoding.lower(), None)
+    return types
+
+
+EXTENSION_TYPES = _extension_types()
+
+
+def extension_type(extension):
+    """
+    Return the content type for a file extension, with or without dot, or
+    None if it is unknown.
+    """
+    if not extension.startswith('.'):
+        extension = '.' + extension
+    return EXTENSION_TYPES.get(extension.lower())
+
+
+@lru_cache(maxsize=256)
+def accepted_types(accept):
+    """
+    Return the media types of an Accept header, most preferred first.
+
+    Types are ordered by their quality (q), keeping the order of the header
+    among equals. Types with q=0, or an invalid q, are left out.
+    """
+    weighted = []
+    for entry in accept.split(','):
+        media_type, *params = entry.split(';')
+        media_type = media_type.strip().lower()
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            weighted.append((quality, media_type))
+    weighted.sort(key=lambda item: -item[0])
+    return tuple(media_type for quality, media_type in weighted)
+
+
+def accepted_type(accept):
+    """
+    Return the content type to respond with according to an Accept header,
+    or None if the most preferred type is a general one (see GENERAL_TYPES).
+
+    Of the other types, the most preferred one we have a handler for is
+    taken, or else simply the most preferred one.
+    """
+    types = accepted_types(accept)
+    if not types or types[0] in GENERAL_TYPES or types[0].endswith('/*'):
+        return None
+    for media_type in types:
+        if media_type in handlers and media_type not in GENERAL_TYPES:
+            return media_type
+    return types[0]
+
+
+def sniff_content_type(request):
+    """
+    Return the content type the body of the request looks like, or None.
+
+    The handlers of spynl are sniffed in one go on the start of the raw
+    body. Sniff functions of handlers added by plugins get the body as text.
+    """
+    match = SNIFF_EXPRESSION.match(request.body)
+    if match:
+        return SNIFFED_TYPES[match.lastindex - 1]
+    for key, values in handlers.items():
+        sniff = values.get('sniff')
+        if sniff and sniff not in BUILTIN_SNIFFS and sniff(request.text):
+            return key
+    return None
+
 
 def negotiate_request_content_type(request):
     """
@@ -31,9 +166,9 @@ def negotiate_request_content_type(request):
     """
     content_type = request.content_type
     if not content_type or content_type not in handlers:
-        for key, values in handlers.items():
-            if 'sniff' in values and values['sniff'](request.text):
-                return key
+        sniffed = sniff_content_type(request)
+        if sniffed:
+            return sniffed
 
     if not content_type:
         if not request.body:
@@ -52,7 +187,7 @@ def negotiate_response_content_type(request):
 
     Priorisation:
     1. file extension in the URL
-    2. Accept Header (only first mentioned type)
+    2. Accept Header (see accepted_type)
     3. Originally set Content-Type (e.g. browser default or set by a view)
     4. Spynl default (application/json)
     """
@@ -61,12 +196,8 @@ def negotiate_response_content_type(request):
         if request.path_extension:
             content_type = request.path_extension
 
-    accept_type = None
-    if 'Accept' in request.headers:
-        accept_type = request.headers['Accept'].split(',')[0]
-    # we use accept only if it is not one of the general types
-    if not content_type and accept_type and accept_type not in ('text/html', '*/*'):
-        content_type = accept_type
+    if not content_type and 'Accept' in request.headers:
+        content_type = accepted_type(request.headers['Accept'])
 
     if not content_type:
         content_type = request.response.content_type
@@ -76,7 +207,7 @@ def negotiate_response_content_type(request):
 
     # make proper type description if we only have a short name (e.g. 'csv')
     if content_type and '/' not in content_type:
-        content_type = guess_type('file.' + content_type)[0]
+        content_type = extension_type(content_type)
 
     return content_type
 
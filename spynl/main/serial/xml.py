@@ -1,7 +1,10 @@
 """Handle XML content"""
 
-from xml.etree.ElementTree import fromstring, ParseError
+from collections.abc import Iterator
+from functools import lru_cache
+from xml.etree.ElementTree import XMLPullParser, ParseError
 from xml.sax import saxutils
+import itertools
 import re
 
 from spynl.main.serial import objects
@@ -10,86 +13,208 @@ from spynl.main.serial.exceptions import MalformedRequestException
 
 EXPRESSION = re.compile(r'^\s*\<')
 
+# streamed input is read in chunks of this many bytes
+CHUNK_SIZE = 64 * 1024
+
 
 def loads(body, headers=None, context=None):
     """return body as XML"""
+    for _, dic in _parse(_events([body])):
+        pass
+    return objects.get_decoder(context=context)(dic)
+
+
+def iterloads(stream, context=None, chunk_size=CHUNK_SIZE, **kwargs):
+    """
+    Yield the items of the collection 'data' in XML read from stream (a
+    binary file, e.g. request.body_file), one at a time.
+
+    Elements are converted and freed as they close, so the body is never
+    in memory as a whole. Other elements are parsed, but not kept.
+    """
+    first = stream.read(chunk_size)
+    if not first.strip():
+        return
+    chunks = itertools.chain([first], iter(lambda: stream.read(chunk_size), b''))
+    decoder = objects.get_decoder(context=context)
+    for depth, value in _parse(_events(chunks), stream_data=True):
+        if depth:
+            yield decoder(value) if isinstance(value, dict) else value
+
+
+def _events(chunks):
+    """Yield the start and end events of the XML in chunks (str or bytes)."""
+    parser = XMLPullParser(events=('start', 'end'))
     try:
-        root = fromstring(body)
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
     except ParseError as err:
         # pylint: disable=E1101
         raise MalformedRequestException('application/xml', error_cause=str(err))
 
-    dic = __loads(root, True)
-    return objects.SpynlDecoder(context=context)(dic)
 
+def _parse(events, stream_data=False):
+    """
+    Convert the elements of the events as they close, and yield the root
+    as (0, structure) at the end.
+
+    The root becomes a dict. Elements with type="collection" become lists,
+    other elements with children dicts, and the rest their stripped text
+    (None if there is none). If stream_data is set, the items of the
+    collection 'data' of the root are yielded as (2, item) instead of kept.
+    """
+    elements = []
+    children = []
+    streaming = False
+    for event, element in events:
+        if event == 'start':
+            if (
+                stream_data
+                and len(elements) == 1
+                and element.tag == 'data'
+                and element.get('type') == 'collection'
+            ):
+                streaming = True
+            elements.append(element)
+            children.append([])
+            continue
+
+        elements.pop()
+        items = children.pop()
+        depth = len(elements)
+        if not depth:
+            value = dict(items)
+        elif element.get('type') == 'collection':
+            value = [item for _, item in items]
+        elif items:
+            value = dict(items)
+        else:
+            value = element.text.strip() if element.text else None
 
-def __loads(element, force_dict=False):
-    """Recurse through etree node, return parsed structure"""
-    if element and element.get('type') != 'collection' or force_dict:
-        # this is a mapping (dict)
-        result = {}
-        for field in element:
-            result[field.tag] = __loads(field)
-    elif element.get('type') == 'collection':
-        # this is a collection (list)
-        result = [__loads(item) for item in element]
-    else:
-        # this is a value
-        result = None
-        if element.text:
-            result = element.text.strip()
+        if not depth:
+            yield 0, value
+        elif depth == 2 and streaming:
+            yield 2, value
+        else:
+            children[-1].append((element.tag, value))
+            if depth == 1:
+                streaming = False
 
-    return result
+        # free the element, it was converted
+        element.clear()
+        if depth:
+            elements[-1].remove(element)
 
 
-def dumps(body, pretty=True):
-    """return XML body as string"""
-    result = __dumps(body)
+# streamed output is yielded after this many items under 'data'
+CHUNK_ITEMS = 1000
+
+INDENT = ' ' * 4
+
 
-    if pretty:
-        result = prettify_xml(result)
+@lru_cache(maxsize=4096)
+def tag_names(field):
+    """
+    Return the start (without closing >) and end tag for a field.
 
-    # concatenating bytes and str objects to one str
-    ustr = ''
-    for item in result:
-        ustr += str(item)
+    Query operators lose their $, field names which start with a digit
+    are written as items with a key attribute.
+    """
+    if field.startswith('$'):  # e.g. query operators
+        field = field[1:]
+    if re.match(r'\D', field):  # alphanumeric field name?
+        return '<' + field, '</{}>'.format(field)
+    return '<item key="{}"'.format(field), '</item>'
 
-    return '<response>{}{}</response>'.format(pretty * '\n', ustr)
 
+def dumps(body, pretty=True):
+    """return XML body as string"""
+    parts = ['<response>\n' if pretty else '<response>']
+    _write(body, parts, 1 if pretty else None)
+    parts.append('</response>')
+    return ''.join(parts)
+
+
+def iterdumps(body, pretty=True):
+    """
+    Yield XML body as strings, writing the items under 'data' one by one.
+
+    'data' can be any iterable, e.g. a generator or a database cursor.
+    """
+    depth = 1 if pretty else None
+    parts = ['<response>\n' if pretty else '<response>']
+    for field, value in body.items():
+        if field != 'data' or not isinstance(value, (list, tuple, Iterator)):
+            _write_field(field, value, parts, depth)
+            continue
+
+        start, end = tag_names(field)
+        start += ' type="collection">'
+        if pretty:
+            parts.append(INDENT + start + '\n')
+        else:
+            parts.append(start)
+        for count, item in enumerate(value, 1):
+            _write_element('<item>', '</item>', item, parts, depth and 2)
+            if count % CHUNK_ITEMS == 0:
+                yield ''.join(parts)
+                parts = []
+        parts.append(INDENT + end + '\n' if pretty else end)
+
+    parts.append('</response>')
+    yield ''.join(parts)
 
-def __dumps(value):
-    """Recurse through dict/list structure, returning XML text"""
-    result = []
 
+def _write(value, parts, depth):
+    """
+    Recurse through dict/list structure, appending XML text to parts.
+
+    depth is the level of indentation for pretty output, None for compact
+    output.
+    """
     if isinstance(value, (list, tuple, set)):
         for item in value:
-            result.append('<item>')
-            result.extend(__dumps(item))
-            result.append('</item>')
+            _write_element('<item>', '</item>', item, parts, depth)
     elif isinstance(value, dict):
         for field, val in value.items():
-            if field.startswith('$'):  # e.g. query operators
-                field = field[1:]
-
-            alpha = re.match(r'\D', field)  # alphanumeric field name?
-
-            start_tag = '<' + (field if alpha else 'item')
-            if not alpha:
-                start_tag += ' key="{}"'.format(field)
-            if isinstance(val, (list, tuple)):
-                start_tag += ' type="collection"'
-            start_tag += '>'
-            end_tag = '</{}>' if alpha else '</item>'
-
-            result.append(start_tag.format(field))
-            result.extend(__dumps(val))
-            result.append(end_tag.format(field))
+            _write_field(field, val, parts, depth)
     else:
         if isinstance(value, str):
             value = saxutils.escape(value)
-        result.append(objects.encode(value))
+        parts.append(objects.encode(value))
+
 
-    return result
+def _write_field(field, value, parts, depth):
+    """Append the element for a field of a dict to parts."""
+    start, end = tag_names(field)
+    if isinstance(value, (list, tuple)):
+        start += ' type="collection">'
+    else:
+        start += '>'
+    _write_element(start, end, value, parts, depth)
+
+
+def _write_element(start, end, value, parts, depth):
+    """
+    Append an element to parts. In pretty output, elements which contain
+    elements have their tags on lines of their own.
+    """
+    if depth is None:
+        parts.append(start)
+        _write(value, parts, None)
+        parts.append(end)
+    elif isinstance(value, (list, tuple, set, dict)):
+        indent = INDENT * depth
+        parts.append(indent + start + '\n')
+        _write(value, parts, depth + 1)
+        parts.append(indent + end + '\n')
+    else:
+        parts.append(INDENT * depth + start)
+        _write(value, parts, depth)
+        parts.append(end + '\n')
 
 
 def sniff(body):
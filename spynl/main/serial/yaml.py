@@ -1,15 +1,47 @@
 """Handle YAML content"""
 
+from decimal import Decimal
 import re
 
 import yaml
 
+from spynl.main.serial import objects
 from spynl.main.serial.exceptions import MalformedRequestException
 
+# use libyaml if it is available, only ever with the safe loader and dumper
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader, SafeDumper
+
 
 EXPRESSION = re.compile(r'^\s*\-')
 
 
+class Dumper(SafeDumper):
+    """
+    Safe YAML dumper, which writes types YAML does not know about as
+    strings, encoded with the encode functions (see objects.encode).
+    """
+
+
+def represent_encoded(dumper, data):
+    """Represent data as the string it is encoded to."""
+    return dumper.represent_str(objects.encode(data))
+
+
+def represent_decimal(dumper, data):
+    """Represent a Decimal as a float, like in JSON."""
+    return dumper.represent_float(float(data))
+
+
+Dumper.add_representer(Decimal, represent_decimal)
+Dumper.add_representer(tuple, SafeDumper.represent_list)
+Dumper.add_multi_representer(dict, SafeDumper.represent_dict)
+Dumper.add_multi_representer(list, SafeDumper.represent_list)
+Dumper.add_multi_representer(object, represent_encoded)
+
+
 def sniff(body):
     """Sniff body content, return True if YAML detected"""
     return bool(re.match(EXPRESSION, body))
@@ -17,12 +49,14 @@ def sniff(body):
 
 def dumps(body, pretty=False):
     """return YAML body as string"""
-    return yaml.dump(body, indent=4) if pretty else yaml.dump(body)
+    if pretty:
+        return yaml.dump(body, Dumper=Dumper, indent=4)
+    return yaml.dump(body, Dumper=Dumper)
 
 
 def loads(body, headers=None, **kwargs):
     """return body as YAML"""
     try:
-        return yaml.load(body)
-    except ValueError as err:
+        return yaml.load(body, Loader=SafeLoader)
+    except (ValueError, yaml.YAMLError) as err:
         raise MalformedRequestException('application/x-yaml', error_cause=str(err))
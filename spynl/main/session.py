@@ -1,6 +1,7 @@
 """Configuration for session factory"""
 
 from spynl.main.exceptions import SpynlException
+from spynl.main.timing import timed
 from spynl.main.utils import get_parsed_body
 
 
@@ -39,6 +40,8 @@ def main(config):
         sid = None
         # getting the sid from request.args would be easier,
         # but we cannot rely on args being unified there already.
+        # The body is parsed only once (see get_parsed_body), so this
+        # costs nothing extra.
         # We look for a session ID (sid) with decreasing priority in
         # cookies, headers, GET vars, POST vars.
         try:
@@ -67,4 +70,4 @@ def main(config):
             else:
                 session.save()
 
-    config.add_subscriber(new_response, 'pyramid.events.NewResponse')
+    config.add_subscriber(timed(new_response, 'session'), 'pyramid.events.NewResponse')
@@ -0,0 +1,217 @@
+"""
+Timing of the stages of a request.
+
+If the setting spynl.timing is true, the time spent in the event subscribers
+of spynl.main, the view and the renderer is measured for every request. The
+durations are sent back in a Server-Timing header and added to histograms per
+endpoint and stage, which can be seen at /about/timings. Requests for which no
+view was found (or which failed before) share one histogram.
+"""
+
+import functools
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from time import perf_counter
+
+from pyramid.settings import asbool
+from pyramid.events import NewResponse
+
+from spynl.main.utils import get_settings
+
+
+# upper bounds (in milliseconds) of the histogram buckets, the last bucket
+# holds everything slower
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# the endpoint of requests which did not get to a view
+UNMATCHED = 'unmatched'
+
+
+class RequestTimings(object):
+    """The stage durations (in seconds) of one request, in the order measured."""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.stages = OrderedDict()
+        self.endpoint = UNMATCHED
+
+    def add(self, stage, seconds):
+        """Add seconds to the duration of stage."""
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def server_timing(self):
+        """Return the value of the Server-Timing header."""
+        return ', '.join(
+            '{};dur={:.2f}'.format(stage, seconds * 1000)
+            for stage, seconds in self.stages.items()
+        )
+
+
+class Histogram(object):
+    """Counts of durations per bucket, with their count, sum and maximum."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, milliseconds):
+        """Count a duration."""
+        self.buckets[bisect_left(BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    def as_dict(self):
+        """Return the histogram as a dictionary, buckets by their bound."""
+        labels = ['<={}'.format(bound) for bound in BUCKETS]
+        labels.append('>{}'.format(BUCKETS[-1]))
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0,
+            'max_ms': round(self.max, 3),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class Histograms(object):
+    """The histograms of all endpoints and stages, safe to use from threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def add(self, endpoint, timings):
+        """Add the stage durations of one request of endpoint."""
+        with self.lock:
+            stages = self.endpoints.setdefault(endpoint, {})
+            for stage, seconds in timings.stages.items():
+                if stage not in stages:
+                    stages[stage] = Histogram()
+                stages[stage].add(seconds * 1000)
+
+    def as_dict(self):
+        """Return the histograms as dictionaries per endpoint and stage."""
+        with self.lock:
+            return {
+                endpoint: {stage: hist.as_dict() for stage, hist in stages.items()}
+                for endpoint, stages in self.endpoints.items()
+            }
+
+
+def get_timings(request):
+    """Return the RequestTimings of request, None if timing is off."""
+    return vars(request).get('timings')
+
+
+def timed(subscriber, stage=None):
+    """
+    Wrap an event subscriber so its duration is added to the timings of the
+    request, under stage (or the name of the subscriber).
+    """
+    stage = stage or subscriber.__name__
+
+    @functools.wraps(subscriber)
+    def timed_subscriber(event):
+        timings = get_timings(event.request)
+        if timings is None:
+            return subscriber(event)
+        start = perf_counter()
+        try:
+            return subscriber(event)
+        finally:
+            timings.add(stage, perf_counter() - start)
+
+    return timed_subscriber
+
+
+def timing_tween_factory(handler, registry):
+    """Start the timings of every request."""
+
+    def timing_tween(request):
+        request.timings = RequestTimings()
+        return handler(request)
+
+    return timing_tween
+
+
+def time_rendering(view, info):
+    """
+    Measure the view and renderer together, the renderer is what is left
+    after the view (see time_view).
+    """
+
+    def wrapper_view(context, request):
+        timings = get_timings(request)
+        if timings is None:
+            return view(context, request)
+        view_before = timings.stages.get('view', 0)
+        start = perf_counter()
+        try:
+            return view(context, request)
+        finally:
+            view_seconds = timings.stages.get('view', 0) - view_before
+            timings.add('renderer', perf_counter() - start - view_seconds)
+
+    return wrapper_view
+
+
+def time_view(view, info):
+    """Measure the view, and note which endpoint the request got to."""
+
+    def wrapper_view(context, request):
+        timings = get_timings(request)
+        if timings is None:
+            return view(context, request)
+        if getattr(request, 'exception', None) is None:
+            timings.endpoint = endpoint_of(request)
+        start = perf_counter()
+        try:
+            return view(context, request)
+        finally:
+            timings.add('view', perf_counter() - start)
+
+    return wrapper_view
+
+
+def endpoint_of(request):
+    """
+    Return the name to keep the timings of request under: the route and
+    method of a resource endpoint, or the name of a basic one. Only known
+    endpoints are named, so clients cannot make up new histograms.
+    """
+    if getattr(request, 'matched_route', None):
+        return '{}:{}'.format(
+            request.matched_route.name, getattr(request, 'endpoint_method', '')
+        )
+    return '/' + request.view_name
+
+
+def record_timings(event):
+    """
+    Add the total, send the timings in the Server-Timing header and add them
+    to the histograms. This should be the last NewResponse subscriber.
+    """
+    timings = get_timings(event.request)
+    if timings is None:
+        return
+    timings.add('total', perf_counter() - timings.start)
+    event.response.headers['Server-Timing'] = timings.server_timing()
+    get_settings()['spynl.timing.histograms'].add(timings.endpoint, timings)
+
+
+def main(config):
+    """
+    Time requests if spynl.timing is set. This should come after all other
+    event subscribers are added.
+    """
+    if not asbool(config.get_settings().get('spynl.timing', False)):
+        return
+    config.add_settings({'spynl.timing.histograms': Histograms()})
+    config.add_tween('spynl.main.timing.timing_tween_factory')
+    config.add_view_deriver(time_rendering)
+    config.add_view_deriver(time_view, under='rendered_view', over='mapped_view')
+    config.add_subscriber(record_timings, NewResponse)
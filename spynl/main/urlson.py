@@ -2,6 +2,10 @@
 This module is used to parse JSON-like objects from the URL into a python
 structure of dicts and lists.
 
+The parser makes a single pass over the string: patterns are matched at an
+offset instead of on the remainder of the string, so parsing is linear in
+the length of the input.
+
 Be aware that all values will be strings, so parse anything that you expect
 to be something else, e.g. an int.
 
@@ -54,35 +58,49 @@ class Parser:
     def __init__(self):
         """initialise parser"""
         self.stack = [[{}, 'value']]
+        self.events = {
+            'object_start': self.object_start,
+            'array_start': self.array_start,
+            'key': self.key,
+            'literal': self.literal,
+            'object_stop': self.stop,
+            'array_stop': self.stop,
+        }
 
     def __call__(self, event, token):
         """call parser"""
-        stack = self.stack
-        top = stack[-1]
-        value = top[0]
+        self.events[event](token)
+
+    def object_start(self, token):
+        """a new object starts"""
+        self.stack.append([{}, None])
+
+    def array_start(self, token):
+        """a new array starts"""
+        self.stack.append([[], None])
 
-        if event == 'object_start':
-            stack.append([{}, None])
-        elif event == 'array_start':
-            stack.append([[], None])
-        elif event == 'key':
-            top[1] = token
-        elif event == 'literal':
-            # decide if we have to append to a list or set in a dict
-            if isinstance(value, list):
-                value.append(token)  # pylint: disable=E1101
-            elif isinstance(value, dict):  # should be one line (first test)
-                dict_key = top[1]
-                value[dict_key] = token
-        elif event in ['object_stop', 'array_stop']:
-            parent_value = stack[-2][0]
-            if isinstance(parent_value, list):
-                parent_value.append(value)
-            elif isinstance(parent_value, dict):
-                parent_key = stack[-2][1]
-                parent_value[parent_key] = value
-
-            stack.pop()
+    def key(self, token):
+        """remember the key for the next value in the current object"""
+        self.stack[-1][1] = token
+
+    def literal(self, token):
+        """add a literal to the current array or object"""
+        top = self.stack[-1]
+        value = top[0]
+        # decide if we have to append to a list or set in a dict
+        if isinstance(value, list):
+            value.append(token)
+        else:
+            value[top[1]] = token
+
+    def stop(self, token):
+        """add the finished array or object to its parent"""
+        value = self.stack.pop()[0]
+        parent = self.stack[-1]
+        if isinstance(parent[0], list):
+            parent[0].append(value)
+        else:
+            parent[0][parent[1]] = value
 
     @property
     def value(self):
@@ -117,9 +135,9 @@ class UnexpectedEndOfInput(ValueError):
 
 def handle_ws(urlson, offset=0):
     """return index of next non-whitespace character"""
-    result = re.match(WS, urlson[offset:])
+    result = WS.match(urlson, offset)
     if result:
-        offset += result.end()
+        offset = result.end()
     return offset
 
 
@@ -149,11 +167,10 @@ def value_ctx(urlson, cb, offset=0, ctx=None):
         cb('literal', urlson[offset:].strip())
         offset = len(urlson)
     elif ctx[-2] in ['array', 'object']:
-        expr = LITERALS[ctx[-2]]
-        result = re.match(expr, urlson[offset:])
+        result = LITERALS[ctx[-2]].match(urlson, offset)
         if result:
-            cb('literal', result.groups()[0].strip())
-            offset += result.end()
+            cb('literal', result.group(1).strip())
+            offset = result.end()
         else:
             cb('literal', '')
     else:
@@ -215,10 +232,10 @@ def object_ctx(urlson, cb, offset=0, ctx=None):
         elif urlson[offset] == ',':
             offset += 1
         else:
-            result = re.match(KEY, urlson[offset:])
+            result = KEY.match(urlson, offset)
             if result:
-                offset += result.end()
-                cb('key', result.groups()[0].strip())
+                offset = result.end()
+                cb('key', result.group(1).strip())
 
                 if offset == len(urlson):
                     raise UnexpectedEndOfInput()
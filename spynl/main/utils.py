@@ -7,7 +7,11 @@ import traceback
 import sys
 import os
 import contextlib
-from functools import wraps
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import lru_cache, wraps
 from inspect import isclass, getfullargspec
 import yaml
 from tld import get_tld
@@ -132,6 +136,41 @@ def handle_pre_flight_request(endpoint, info):
     return wrapper
 
 
+class OriginMatcher(object):
+    """
+    The origin whitelists, parsed once.
+
+    The dev whitelist is expected to hold either complete URLs or mere
+    protocols (e.g. "chrome-extension://"), the tld whitelist only top-level
+    domains. Complete URLs and top-level domains are kept in sets, protocols
+    in a tuple for str.startswith. Recent decisions are kept in a bounded
+    LRU cache, as origins are chosen by the client.
+    """
+
+    def __init__(self, dev_whitelist='', tld_whitelist='', cache_size=1024):
+        dev_whitelist = parse_csv_list(dev_whitelist)
+        self.urls = frozenset(url for url in dev_whitelist if not url.endswith('://'))
+        self.protocols = tuple(url for url in dev_whitelist if url.endswith('://'))
+        self.tlds = frozenset(parse_csv_list(tld_whitelist))
+        self.is_allowed = lru_cache(maxsize=cache_size)(self._is_allowed)
+
+    def _is_allowed(self, origin):
+        """Return True if origin matches one of the whitelists."""
+        if origin in self.urls or origin.startswith(self.protocols):
+            return True
+        try:
+            tld = get_tld(origin)
+        except (TldBadUrl, TldDomainNotFound):
+            tld = origin  # dev domains like e.g. 0.0.0.0:9000 will fall here
+        return tld in self.tlds
+
+
+@lru_cache(maxsize=16)
+def get_origin_matcher(dev_whitelist, tld_whitelist):
+    """Return the OriginMatcher for these whitelists, made once."""
+    return OriginMatcher(dev_whitelist, tld_whitelist)
+
+
 def is_origin_allowed(origin):
     """
     Check request origin for matching our whitelists.
@@ -145,22 +184,11 @@ def is_origin_allowed(origin):
         return True
 
     settings = get_settings()
-    dev_whitelist = parse_csv_list(settings.get('spynl.dev_origin_whitelist', ''))
-    dev_list_urls = [url for url in dev_whitelist if not url.endswith('://')]
-    origin_allowed = origin in dev_list_urls
-    dev_list_protocols = [url for url in dev_whitelist if url.endswith('://')]
-    for protocol in dev_list_protocols:
-        if origin.startswith(protocol):
-            origin_allowed = True
-    if not origin_allowed:
-        try:
-            tld = get_tld(origin)
-        except (TldBadUrl, TldDomainNotFound):
-            tld = origin  # dev domains like e.g. 0.0.0.0:9000 will fall here
-        tld_whitelist = parse_csv_list(settings.get('spynl.tld_origin_whitelist', ''))
-        if tld in tld_whitelist:
-            origin_allowed = True
-    return origin_allowed
+    matcher = get_origin_matcher(
+        settings.get('spynl.dev_origin_whitelist', ''),
+        settings.get('spynl.tld_origin_whitelist', ''),
+    )
+    return matcher.is_allowed(origin)
 
 
 def get_header_args(request):
@@ -181,21 +209,62 @@ def get_header_args(request):
     return headers
 
 
+def streams_body(request):
+    """
+    Return if the endpoint of the request reads the body itself, see the
+    stream_body option of add_endpoint.
+    """
+    streamed = get_settings().get('spynl.streamed_bodies')
+    if not streamed:
+        return False
+    # before traversal, the endpoint is not known yet
+    context = getattr(request, 'context', None)
+    if context is None:
+        return False
+    if getattr(request, 'matched_route', None):
+        method = (request.matchdict or {}).get('method', '')
+        return (context.__class__, method) in streamed
+    return (None, request.view_name) in streamed
+
+
+def parse_body(request):
+    """Parse the body of the request with spynl.post_parser (or as JSON)."""
+    body_parser = get_settings().get('spynl.post_parser')
+    if body_parser:
+        return body_parser(request)
+    return {} if not request.body else json.loads(request.body)
+
+
 def get_parsed_body(request):
-    """Return the body of the request parsed if request was POST or PUT."""
-    settings = get_settings()
-    body_parser = settings.get('spynl.post_parser')
+    """
+    Return the body of the request parsed if request was POST or PUT, and
+    if the endpoint does not read the body itself (see streams_body).
 
-    if request.method in ('POST', 'PUT'):
-        if body_parser:
-            request.parsed_body = body_parser(request)
-        else:
-            request.parsed_body = {} if not request.body else json.loads(request.body)
-    else:
+    The body is parsed once per request, the session factory, the args and
+    error views all get the same result (or the same error) from then on.
+    Fields are decoded according to the context, so before the context is
+    known, the body is parsed but not kept.
+    """
+    if request.method not in ('POST', 'PUT') or streams_body(request):
         # disregard any body content if not a POST of PUT request
-        request.parsed_body = {}
+        return {}
+
+    if getattr(request, 'context', None) is None:
+        return parse_body(request)
+
+    cache = vars(request)
+    if 'parsed_body' in cache:
+        return cache['parsed_body']
+    if 'parsed_body_error' in cache:
+        raise cache['parsed_body_error']
 
-    return request.parsed_body
+    try:
+        parsed_body = parse_body(request)
+    except Exception as err:
+        cache['parsed_body_error'] = err
+        raise
+    request.parsed_body = parsed_body
+    return parsed_body
 
 
 def unify_args(request):
@@ -206,27 +275,23 @@ def unify_args(request):
     It is possible to provide a custom parser for the POST body in the
     settings. Complex data can be given via GET as a JSON string.
     GET would overwrite POST when parameter names collide.
+
+    This is request.args, which is reified: the args are only brought
+    together when an endpoint first uses them. The body itself is parsed
+    once per request, see get_parsed_body.
     """
     args = {}
     # get headers first, they might be useful for parsing the body
     args.update(get_header_args(request))
     # get POST data
     args.update(get_parsed_body(request))
-    # get GET args, can be written in JSON style
-    # args.update(urlson.loads_dict(request.GET))
-    # TODO: needs some refactoring - maybe urlson can actually do this parsing
-    # for us. We don't know the context yet.
+    # get GET args, can be written in JSON style, and run the decode
+    # functions over them
     from spynl.main.serial import objects
 
     context = hasattr(request, 'context') and request.context or None
-    args.update(
-        json.loads(
-            json.dumps(urlson.loads_dict(request.GET)),
-            object_hook=objects.SpynlDecoder(context=context),
-        )
-    )
-
-    request.endpoint_method = find_view_name(request)
+    decoder = objects.get_decoder(context=context)
+    args.update(decoder.decode(urlson.loads_dict(request.GET)))
 
     # get cookies, but do not overwrite explicitly given settings
     for key in request.cookies:
@@ -243,6 +308,45 @@ def unify_args(request):
     return args
 
 
+def move_sid_to_headers(request):
+    """
+    Move the sid to the headers, where it lives (see unify_args), as soon as
+    the endpoint is known, so it is there when permissions are checked.
+
+    It is looked for as in the args: headers, body, GET and cookies. A POST or
+    PUT body is parsed for this (once, see get_parsed_body); an error in it
+    is left to whoever uses the args.
+    """
+    sid = request.headers.get('sid')
+    try:
+        body = get_parsed_body(request)
+    except Exception:  # pylint: disable=broad-except
+        body = {}
+    if 'sid' in body:
+        sid = body['sid']
+    if 'sid' in request.GET:
+        sid = request.GET['sid']
+    if sid is None:
+        sid = request.cookies.get('sid')
+    if sid:
+        request.headers['sid'] = sid
+
+
+def known_args(request):
+    """
+    Return the args as far as they are known without parsing anything: the
+    body if it was parsed (see get_parsed_body), GET, and cookies for names
+    not given otherwise. The sid is left out, as in the args.
+    """
+    body = getattr(request, 'parsed_body', None)
+    args = dict(body) if isinstance(body, dict) else {}
+    args.update(request.GET)
+    for key in request.cookies:
+        args.setdefault(key, request.cookies[key])
+    args.pop('sid', None)
+    return args
+
+
 def find_view_name(request):
     """find the view name
     TODO: I believe this is not completely generic.
@@ -276,11 +380,86 @@ def get_user_info(request, purpose=None):
     The user_info function should return a dictionary with
     information about the (authenticated) user. If no information is
     available it should return an empty dictionary.
+
+    The result is cached on the request per purpose, as it is asked for
+    many times per request (e.g. for every date that is localised). Use
+    forget_user_info if the user changes during the request.
     """
+    cache = getattr(request, 'user_info_cache', None)
+    if cache is not None and purpose in cache:
+        return cache[purpose]
+
     try:
-        return request.registry.settings['user_info_function'](request, purpose)
+        user_info = request.registry.settings['user_info_function'](request, purpose)
     except (KeyError, AttributeError, TypeError):
-        return _get_user_info(request)
+        user_info = _get_user_info(request)
+
+    if cache is not None:
+        cache[purpose] = user_info
+    return user_info
+
+
+def user_info_cache(request):
+    """The per-request cache of get_user_info, added as a reified property."""
+    return {}
+
+
+def forget_user_info(request):
+    """
+    Clear the cached user info, e.g. after a user logged in, and the date
+    context which depends on it.
+    """
+    cache = getattr(request, 'user_info_cache', None)
+    if cache is not None:
+        cache.clear()
+    vars(request).pop('date_context', None)
+
+
+def cache_user_info(ttl=60, maxsize=1024, key=None):
+    """
+    Decorate a user_info function of a plugin to cache its results across
+    requests for ttl seconds, for functions that e.g. look the user up in a
+    database. This is opt-in, as changes to the user show up late.
+
+    key is called with the request and purpose and should return a hashable
+    key for the user, or None to not cache. By default the authenticated
+    userid and the purpose are used.
+    """
+    if key is None:
+
+        def key(request, purpose):
+            userid = getattr(request, 'authenticated_userid', None)
+            return (userid, purpose) if userid is not None else None
+
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(request, purpose=None):
+            cache_key = key(request, purpose)
+            if cache_key is None:
+                return func(request, purpose)
+
+            now = time.monotonic()
+            with lock:
+                entry = cache.get(cache_key)
+                if entry is not None and entry[0] > now:
+                    cache.move_to_end(cache_key)
+                    return dict(entry[1])
+
+            user_info = func(request, purpose)
+            with lock:
+                cache[cache_key] = (now + ttl, user_info)
+                cache.move_to_end(cache_key)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return dict(user_info)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
 
 
 def _get_user_info(request):
@@ -338,6 +517,74 @@ def get_logger(name=None):
     return logging.getLogger(name)
 
 
+class LogPayload(Mapping):
+    """
+    The arguments of a request, as they are logged.
+
+    Nothing is copied when the payload is made, so it costs nothing if the
+    record is never formatted. When a handler reads it, a shallow copy is
+    made in which the values of the redacted keys (spynl.log_redact_keys)
+    are masked. As a string, the payload is JSON of at most
+    spynl.log_payload_size characters, of which only that much is encoded.
+
+    args can also be a function returning them (e.g. lambda: request.args),
+    which is only called when the payload is read. If it fails, the payload
+    is empty; the error is for whoever uses the args.
+    """
+
+    mask = '*********'
+
+    def __init__(self, args, redact=None, max_size=None):
+        settings = get_settings()
+        if redact is None:
+            redact = parse_csv_list(settings.get('spynl.log_redact_keys', 'password'))
+        if max_size is None:
+            max_size = int(settings.get('spynl.log_payload_size', 10000))
+        self.args = args
+        self.redact = redact
+        self.max_size = max_size
+        self._payload = None
+
+    @property
+    def payload(self):
+        """The arguments with the redacted values masked."""
+        if self._payload is None:
+            args = self.args
+            if callable(args):
+                try:
+                    args = args()
+                except Exception:  # pylint: disable=broad-except
+                    args = {}
+            payload = dict(args)
+            for key in self.redact:
+                if key in payload:
+                    payload[key] = self.mask
+            self._payload = payload
+        return self._payload
+
+    def __getitem__(self, key):
+        return self.payload[key]
+
+    def __iter__(self):
+        return iter(self.payload)
+
+    def __len__(self):
+        return len(self.payload)
+
+    def __str__(self):
+        encoder = json.JSONEncoder(ensure_ascii=False, default=str)
+        parts = []
+        size = 0
+        for part in encoder.iterencode(self.payload):
+            parts.append(part)
+            size += len(part)
+            if size > self.max_size:
+                return ''.join(parts)[: self.max_size] + '...'
+        return ''.join(parts)
+
+    __repr__ = __str__
+
+
 def parse_value(value, class_info):
     '''
     Parse a value. class_info is expected to be a class or a list
@@ -396,7 +643,9 @@ def get_yaml_from_docstring(doc_str, load_yaml=True):
     if yaml_sep != -1:
         yaml_str = doc_str[yaml_sep:]
         if load_yaml:
-            return yaml.load(yaml_str)
+            from spynl.main.serial.yaml import SafeLoader
+
+            return yaml.load(yaml_str, Loader=SafeLoader)
         else:
             return yaml_str
     return None
@@ -3,6 +3,8 @@ import io
 import openpyxl
 
 from spynl.main.serial.file_responses import (
+    ColumnPlan,
+    plan_export,
     export_csv,
     serve_csv_response,
     export_excel,
@@ -72,3 +74,31 @@ def test_export_data_sorting(request):
     sorted_header = export_header(data, reference=reference)
     sorted_data = export_data(data, sorted_header)
     assert sorted_data == [['abc', 'spring', 'G-Star'], ['xyz', 'summer', 'Diesel']]
+
+
+def test_export_excel_from_generator(dummyrequest):
+    data = ({'warehouse': 'w%d' % i, 'brand': i} for i in range(3))
+    temp_file = export_excel(['warehouse', 'brand'], data)
+    resp = serve_excel_response(dummyrequest.response, temp_file, 'filename.xlsx')
+    content = resp.app_iter.file.read()
+    assert resp.content_length == len(content)
+
+    ws = openpyxl.load_workbook(io.BytesIO(content)).active
+    assert [[cell.value for cell in row] for row in ws.rows] == [
+        ['warehouse', 'brand'],
+        ['w0', 0],
+        ['w1', 1],
+        ['w2', 2],
+    ]
+
+
+def test_column_plan_missing_keys():
+    plan = ColumnPlan(['b', 'a'], reference=['a', 'b'])
+    assert plan.header == ['a', 'b']
+    assert list(plan.rows([{'a': 1, 'b': 2}, {'b': 3}])) == [[1, 2], [None, 3]]
+
+
+def test_plan_export_from_iterator():
+    data = iter([{'brand': 'G-Star', 'warehouse': 'abc'}, {'warehouse': 'xyz'}])
+    plan, data = plan_export(data, reference=['warehouse', 'brand'])
+    assert export_csv(plan, data) == 'warehouse,brand\r\nabc,G-Star\r\nxyz,\r\n'
@@ -1,7 +1,7 @@
 """Test functions from spynl.main."""
 from pyramid.testing import DummyRequest
 
-from spynl.main.utils import log_error
+from spynl.main.utils import log_error, LogPayload
 from spynl.main.exceptions import SpynlException
 
 
@@ -110,3 +110,40 @@ def test_log_developer_message(caplog):
         log_error(exc, DummyRequest(), TOP_MSG)
         for rec in caplog.records:
             assert "HI I AM DEVELOPER" in rec.message
+
+
+def test_log_payload_redacts_without_copying(app):
+    """The password is masked in the payload, the args are not changed."""
+    args = {'username': 'user', 'password': 'secret', 'data': [1, 2]}
+    payload = LogPayload(args)
+    assert payload['password'] == LogPayload.mask
+    assert dict(payload) == dict(args, password=LogPayload.mask)
+    assert payload['data'] is args['data']
+    assert args['password'] == 'secret'
+    assert 'secret' not in str(payload)
+
+
+def test_log_payload_size_is_capped():
+    """Only the start of a large payload is written."""
+    payload = LogPayload({'data': list(range(100000))}, redact=[], max_size=50)
+    text = str(payload)
+    assert text.startswith('{"data": [0, 1, 2')
+    assert len(text) == 53
+
+
+def test_log_payload_of_function():
+    """The args are only made when the payload is read, failing gives none."""
+    calls = []
+
+    def args():
+        calls.append(1)
+        return {'a': 1}
+
+    payload = LogPayload(args)
+    assert not calls
+    assert dict(payload) == {'a': 1}
+
+    def bad_args():
+        raise ValueError('bad body')
+
+    assert dict(LogPayload(bad_args)) == {}
@@ -5,6 +5,8 @@ from json import loads
 import pytest
 from pyramid.httpexceptions import HTTPForbidden
 
+from spynl.main.utils import OriginMatcher, get_origin_matcher
+
 
 def test_whitelisted_origin(app):
     """Test whitelisted origin."""
@@ -34,3 +36,18 @@ def test_notwhitelisted_origin(app):
     headers = {"Origin": "http://0.0.0.0:9003"}
     with pytest.raises(HTTPForbidden, match=msg + "'http://0.0.0.0:9003'"):
         app.get('/ping', headers=headers)
+
+
+def test_origin_matcher_caches_decisions():
+    """Decisions for an origin are cached per matcher."""
+    matcher = OriginMatcher('http://0.0.0.0:9001,chrome-extension://', 'swcloud.nl')
+    assert matcher.is_allowed('chrome-extension://abc')
+    assert matcher.is_allowed('http://www.swcloud.nl')
+    assert not matcher.is_allowed('http://www.swcloud.com')
+    assert matcher.is_allowed('http://www.swcloud.nl')
+    assert matcher.is_allowed.cache_info().hits == 1
+
+
+def test_origin_matcher_is_made_once():
+    """The same whitelists give the same matcher."""
+    assert get_origin_matcher('a://', 'b.com') is get_origin_matcher('a://', 'b.com')
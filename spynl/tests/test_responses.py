@@ -5,9 +5,31 @@ We use the endpoints /ping and /request_echo"""
 
 
 from json import loads, dumps
+import logging
+
 import pytest
+from pyramid import testing
 from webtest import AppError
 
+from spynl.main.serial import loads as serial_loads, MalformedRequestException
+from spynl.main.utils import get_settings, get_parsed_body
+
+
+@pytest.fixture
+def import_app(app_factory, settings, monkeypatch):
+    """Plugin an endpoint that reads the documents of the body itself."""
+
+    def patched_plugin_main(config):
+        def import_documents(request):
+            """Count the documents in the body."""
+            count = sum(1 for doc in request.iter_documents)
+            return {'count': count, 'args': sorted(request.args)}
+
+        config.add_endpoint(import_documents, 'import-documents', stream_body=True)
+
+    monkeypatch.setattr('spynl.main.plugins.main', patched_plugin_main)
+    return app_factory(settings)
+
 
 def test_ping(app):
     """Ping test."""
@@ -79,6 +101,17 @@ def test_contenttype_xml(app):
     assert '<param2>blupp</param2>' in response
 
 
+def test_accept_quality(app):
+    """The most preferred type of the Accept header is used."""
+    headers = {'Accept': 'application/json;q=0.5, application/xml'}
+    response = app.get('/request_echo?param1=bla', headers=headers)
+    assert response.content_type == 'application/xml'
+    # browsers prefer html, then we respond with our default
+    headers = {'Accept': 'text/html,application/xml;q=0.9,*/*;q=0.8'}
+    response = app.get('/request_echo?param1=bla', headers=headers)
+    assert response.content_type == 'application/json'
+
+
 def test_contenttype_csv(app):
     """Test contenttype csv, set response type in URL path."""
     data = [{"a": 100, "b": 200}, {"a": 150, "b": 250}]
@@ -112,6 +145,141 @@ def test_bad_json(app):
         app.post('/request_echo', '{', headers=headers)
 
 
+@pytest.fixture
+def session_app(app_factory, settings, monkeypatch):
+    """Plugin an endpoint that uses the session before its args."""
+
+    def patched_plugin_main(config):
+        def session_id(request):
+            """Return the id of the session, then look at the args."""
+            sid = request.session.id
+            return {'sid': sid, 'args': sorted(request.args)}
+
+        config.add_endpoint(session_id, 'session-id')
+
+    monkeypatch.setattr('spynl.main.plugins.main', patched_plugin_main)
+    return app_factory(settings)
+
+
+@pytest.fixture
+def counted_loads(monkeypatch):
+    """Count how often a body is parsed."""
+    calls = []
+
+    def counting_loads(*args, **kwargs):
+        calls.append(args)
+        return serial_loads(*args, **kwargs)
+
+    monkeypatch.setattr('spynl.main.serial.loads', counting_loads)
+    return calls
+
+
+def test_body_parsed_once(app, counted_loads):
+    """The body is parsed once, whether the endpoint uses its args or not."""
+    headers = {'Content-Type': 'application/json'}
+    response = app.post('/ping', dumps({'sid': '123', 'a': 1}), headers=headers)
+    assert loads(response.text)['greeting'] == 'pong'
+    assert len(counted_loads) == 1
+    app.post('/request_echo', dumps({'a': 1}), headers=headers)
+    assert len(counted_loads) == 2
+    app.get('/request_echo?a=1')
+    assert len(counted_loads) == 2
+
+
+def test_parsed_body_cached(app, monkeypatch):
+    """The body is parsed once per request, an error is raised again."""
+    calls = []
+
+    def parse(request):
+        calls.append(request.body)
+        if request.body == b'bad':
+            raise MalformedRequestException('application/json')
+        return {'a': 1}
+
+    monkeypatch.setitem(get_settings(), 'spynl.post_parser', parse)
+    request = testing.DummyRequest(method='POST', body=b'{"a": 1}', context='ctx')
+    body = get_parsed_body(request)
+    assert get_parsed_body(request) is body
+    assert calls == [b'{"a": 1}']
+
+    request = testing.DummyRequest(method='POST', body=b'bad', context='ctx')
+    for _ in range(2):
+        with pytest.raises(MalformedRequestException):
+            get_parsed_body(request)
+    assert calls == [b'{"a": 1}', b'bad']
+
+
+def test_parsed_body_for_context(app, monkeypatch):
+    """A body parsed before the context is known is not kept."""
+    contexts = []
+
+    def parse(request):
+        contexts.append(request.context)
+        return {'context': request.context}
+
+    monkeypatch.setitem(get_settings(), 'spynl.post_parser', parse)
+    request = testing.DummyRequest(method='POST', body=b'{}', context=None)
+    assert get_parsed_body(request) == {'context': None}
+    request.context = 'ctx'
+    assert get_parsed_body(request) == {'context': 'ctx'}
+    assert get_parsed_body(request) == {'context': 'ctx'}
+    assert contexts == [None, 'ctx']
+
+
+def test_body_sid_for_session(session_app):
+    """A sid in the body is used for the session, before the args are."""
+    response = session_app.post('/session-id', dumps({'sid': 'abc123', 'a': 1}))
+    assert loads(response.text)['sid'] == 'abc123'
+    assert loads(response.text)['args'] == ['a']
+
+
+class FormattingHandler(logging.Handler):
+    """A log handler which writes the payload of records."""
+
+    def __init__(self):
+        super().__init__()
+        self.payloads = []
+
+    def emit(self, record):
+        if hasattr(record, 'payload'):
+            self.payloads.append(str(record.payload))
+
+
+@pytest.mark.parametrize('log_payload', [False, True])
+def test_force_text(app, counted_loads, log_payload):
+    """force_text is found in the body and GET, whether it is logged or not."""
+    handler = FormattingHandler()
+    logger = logging.getLogger('spynl.main.utils')
+    level = logger.level
+    if log_payload:
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    try:
+        response = app.post('/ping?force_text=1', '{}')
+        assert response.content_type == 'text/plain'
+        response = app.post('/ping', dumps({'force_text': 1}))
+        assert response.content_type == 'text/plain'
+        response = app.post('/request_echo', dumps({'force_text': 1}))
+        assert response.content_type == 'text/plain'
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+    assert len(counted_loads) == 3
+    assert bool(handler.payloads) is log_payload
+
+
+def test_args_precedence(app):
+    """GET overrides the body, cookies only fill in, the sid is not an arg."""
+    app.set_cookie('a', 'cookie')
+    app.set_cookie('c', 'cookie')
+    response = app.post('/request_echo?a=get&sid=123', dumps({'a': 1, 'b': 2}))
+    args = loads(response.text)
+    assert args['a'] == 'get'
+    assert args['b'] == 2
+    assert args['c'] == 'cookie'
+    assert 'sid' not in args
+
+
 def test_noresource(app):
     """Test no resource, 404 not found error."""
     with pytest.raises(AppError, match='404 Not Found'):
@@ -146,3 +314,12 @@ def test_unicode_roundtrip(app):
     data = {'name': 'H\xf6ning', 'price': '€9'}
     response = app.post('/request_echo', dumps({'data': data})).text
     assert loads(response)['data'] == {'name': 'H\xf6ning', 'price': '€9'}
+
+
+def test_streamed_body(import_app):
+    """Endpoints with stream_body read the body, it is not parsed into args."""
+    body = dumps({'data': [{'a': i} for i in range(1000)], 'extra': 1})
+    response = loads(import_app.post('/import-documents?x=1', body).text)
+    assert response['count'] == 1000
+    assert 'data' not in response['args'] and 'extra' not in response['args']
+    assert 'x' in response['args']
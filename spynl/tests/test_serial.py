@@ -2,14 +2,21 @@
 """Specifically test (de)serialisation with straightforward unit tests."""
 
 from decimal import Decimal
+from io import BytesIO
 
 import datetime
+import enum
+import gc
 import json as json_py
+import uuid
+import weakref
 from xml.etree.ElementTree import fromstring
 
 import pytest
+from pyramid import testing, threadlocal
 
 from spynl.main.dateutils import date_to_str, date_from_str, localize_date
+from spynl.main.utils import get_settings
 
 from spynl.main.serial import (
     handlers,
@@ -17,14 +24,24 @@ from spynl.main.serial import (
     xml,
     csv,
     py,
+    yaml,
+    typing,
     loads,
     dumps,
+    renderer,
     MalformedRequestException,
     UnsupportedContentTypeException,
     DeserializationUnsupportedException,
     SerializationUnsupportedException,
 )
 from spynl.main.serial.csv import loads as csv_loads
+from spynl.main.serial.objects import (
+    CountingEncodeTable,
+    EncodeTable,
+    SpynlDecoder,
+    encode_date_columns,
+    get_decoder,
+)
 
 
 def test_empty():
@@ -173,6 +190,46 @@ def test_xml_sniff_tab():
     assert xml.sniff('   \t<')
 
 
+def test_sniff_content_type():
+    """The content type of the body is sniffed in one go."""
+    for body, content_type in (
+        (b' \n{"a": 1}', 'application/json'),
+        (b'\t<a/>', 'application/xml'),
+        (b'- a', 'application/x-yaml'),
+        (b'a,b', None),
+        (b'', None),
+    ):
+        request = testing.DummyRequest(body=body, text=body.decode())
+        assert typing.sniff_content_type(request) == content_type
+
+
+@pytest.mark.parametrize(
+    'accept,content_type',
+    [
+        ('application/xml', 'application/xml'),
+        ('application/json;q=0.5, application/xml', 'application/xml'),
+        ('application/xhtml+xml, application/json;q=0.9', 'application/json'),
+        ('text/csv; charset=utf-8', 'text/csv'),
+        ('application/xml;q=0, foo/bar', 'foo/bar'),
+        ('text/html,application/xml;q=0.9,*/*;q=0.8', None),
+        ('*/*', None),
+        ('text/*', None),
+        ('', None),
+    ],
+)
+def test_accepted_type(accept, content_type):
+    """The Accept header is ordered by quality, general types are ignored."""
+    assert typing.accepted_type(accept) == content_type
+
+
+def test_extension_type():
+    """Extensions are looked up with or without dot, in any case."""
+    assert typing.extension_type('.json') == 'application/json'
+    assert typing.extension_type('CSV') == 'text/csv'
+    assert typing.extension_type('.gz') is None
+    assert typing.extension_type('.') is None
+
+
 def test_xml_loads_valid():
     """Test valid (xml loads)."""
     valid_xmls = [
@@ -246,6 +303,21 @@ def test_xml_loads_html_umlaut():
         assert xml.loads(data_in) == output
 
 
+@pytest.mark.parametrize('chunk_size', [1, 4096])
+def test_xml_iterloads(app, chunk_size):
+    """The items of the data collection are yielded one by one and decoded."""
+    body = (
+        '<request><action>add</action><data type="collection">'
+        '<item><a>1</a><date>2020-01-01</date></item><item>text</item>'
+        '</data><after>1</after></request>'
+    ).encode('utf-8')
+    items = list(xml.iterloads(BytesIO(body), chunk_size=chunk_size))
+    assert items[0]['a'] == '1'
+    assert isinstance(items[0]['date'], datetime.datetime)
+    assert items[1] == 'text'
+    assert list(xml.iterloads(BytesIO(b''))) == []
+
+
 def test_xml_loads_date(app):
     """Test date (xml loads)."""
     now = datetime.datetime.now()
@@ -332,6 +404,51 @@ def test_xml_dumps_date():
     assert response.find('now').text == date_to_str(localize_date(now))
 
 
+def test_xml_dumps_pretty():
+    """Elements with elements in them have their tags on lines of their own."""
+    body = {'a': 'x & y', '$in': [1, {}], '1': None}
+    assert xml.dumps(body) == (
+        '<response>\n'
+        '    <a>x &amp; y</a>\n'
+        '    <in type="collection">\n'
+        '        <item>1</item>\n'
+        '        <item>\n'
+        '        </item>\n'
+        '    </in>\n'
+        '    <item key="1">None</item>\n'
+        '</response>'
+    )
+    assert xml.dumps(body, pretty=False) == (
+        '<response><a>x &amp; y</a><in type="collection"><item>1</item>'
+        '<item></item></in><item key="1">None</item></response>'
+    )
+
+
+@pytest.mark.parametrize('pretty', [False, True])
+def test_xml_iterdumps_matches_dumps(pretty):
+    """Streaming a generator under data gives the same XML as dumps."""
+    docs = [{'a': 1, 'b': ['x', {'c': 'y'}]}, {'a': 2}]
+    expected = xml.dumps({'status': 'ok', 'data': docs}, pretty=pretty)
+    body = {'status': 'ok', 'data': (doc for doc in docs)}
+    assert ''.join(xml.iterdumps(body, pretty=pretty)) == expected
+
+
+def test_yaml_roundtrip():
+    """YAML is dumped with the safe dumper, other types as strings."""
+    body = {'price': Decimal('1.5'), 'sizes': ('S', 'M'), 'name': 'H\xf6ning'}
+    assert yaml.loads(yaml.dumps(body)) == {
+        'price': 1.5,
+        'sizes': ['S', 'M'],
+        'name': 'H\xf6ning',
+    }
+
+
+def test_yaml_loads_is_safe():
+    """Python objects cannot be made from YAML input."""
+    with pytest.raises(MalformedRequestException):
+        yaml.loads('- !!python/object/apply:os.getcwd []')
+
+
 def test_csv_dumps_simple():
     """Test simple input for csv dumps."""
     body = {'data': [{'a': 1, 'b': 2.5, 'c': True}]}
@@ -461,6 +578,278 @@ def test_csv_loads_csvimport_with_datefield(app):
     assert data['date'].minute, 11
 
 
+def test_csv_loads_quoted_newlines():
+    """Newlines in quoted fields stay in the field."""
+    body = 'name,remark\r\nshirt,"long\nsleeves"\r\nsocks,none\r\n'
+    headers = {'x-spynl-delimiter': ',', 'x-spynl-quotechar': '"'}
+    assert csv_loads(body, headers)['data'] == [
+        {'name': 'shirt', 'remark': 'long\nsleeves'},
+        {'name': 'socks', 'remark': 'none'},
+    ]
+
+
+def test_csv_iterloads_reads_lazily():
+    """Rows are read from the stream one by one, the stream is left open."""
+    lines = ['sku,name,remark'] + [
+        '{0},"product {0}","a\nb"'.format(i) for i in range(5000)
+    ]
+    stream = BytesIO('\n'.join(lines).encode('utf-8'))
+    rows = csv.iterloads(stream)
+    assert next(rows) == {'sku': '0', 'name': 'product 0', 'remark': 'a\nb'}
+    assert stream.tell() < len(stream.getvalue())
+    assert sum(1 for row in rows) == 4999
+    assert not stream.closed
+
+
+@pytest.mark.parametrize('body', [b'', b'  \n'])
+def test_csv_iterloads_empty(body):
+    """An empty body has no rows, as with JSON and XML."""
+    assert list(csv.iterloads(BytesIO(body))) == []
+
+
+def test_csv_iterloads_json():
+    """A JSON body is streamed as JSON."""
+    docs = [{'sku': i, 'name': 'product {}'.format(i)} for i in range(5000)]
+    stream = BytesIO(json_py.dumps({'data': docs}).encode('utf-8'))
+    rows = csv.iterloads(stream)
+    assert next(rows) == docs[0]
+    assert stream.tell() < len(stream.getvalue())
+    assert list(rows) == docs[1:]
+
+
 def test_decimal_json_dumps():
     """test dumping decimals to floats."""
     assert dumps({'a': Decimal(1)}, 'application/json') == '{"a": 1.0}'
+
+
+def test_encode_table_resolves_subclasses():
+    """Subclasses use the encode function of their closest registered base."""
+
+    class SubDate(datetime.datetime):
+        pass
+
+    table = EncodeTable({datetime.datetime: lambda obj: 'a date'})
+    assert table.encode(SubDate(2020, 1, 1)) == 'a date'
+    assert table.lookup(SubDate) is table.lookup(datetime.datetime)
+    assert table.encode(5) == '5'
+
+
+def test_json_encoder_is_reused(app):
+    """The encoder is built once per set of encode functions."""
+    assert json.get_encoder() is json.get_encoder()
+    assert json.get_encoder(pretty=True) is not json.get_encoder()
+
+
+def test_json_encoders_go_with_table(app, monkeypatch):
+    """A replaced encode table is freed, with its encoders."""
+    monkeypatch.setitem(get_settings(), 'serial_encode_table', EncodeTable({}))
+    table = weakref.ref(json.get_encoder().table)
+    # not with monkeypatch, which would keep the replaced table
+    get_settings()['serial_encode_table'] = EncodeTable({})
+    gc.collect()
+    assert table() is None
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4096])
+def test_json_iterloads(app, chunk_size):
+    """Documents are read one by one, also if split over chunks."""
+    docs = [{'date': '2020-01-01', 'name': 'H\xf6ning'}, [1.25, None, True], 10e10]
+    body = json_py.dumps({'filter': {'a': 1}, 'data': docs, 'count': 3})
+    stream = BytesIO(body.encode('utf-8'))
+    loaded = list(json.iterloads(stream, chunk_size=chunk_size))
+    assert loaded == json.loads(body)['data']
+    assert isinstance(loaded[0]['date'], datetime.datetime)
+
+
+@pytest.mark.parametrize('body', [b'', b'{}', b' {"data": []} '])
+def test_json_iterloads_no_documents(app, body):
+    """Empty bodies give no documents."""
+    assert list(json.iterloads(BytesIO(body))) == []
+
+
+@pytest.mark.parametrize(
+    'body', [b'[1]', b'{"data": [1,]}', b'{"data": 1}', b'{"data": [1]} 2']
+)
+def test_json_iterloads_malformed(app, body):
+    """Malformed bodies raise while iterating."""
+    with pytest.raises(MalformedRequestException):
+        list(json.iterloads(BytesIO(body), chunk_size=2))
+
+
+@pytest.fixture
+def orjson_backend(app, monkeypatch):
+    """Use orjson as JSON backend."""
+    pytest.importorskip('orjson')
+    monkeypatch.setitem(get_settings(), 'spynl.json_backend', 'orjson')
+
+
+def test_orjson_dumps_like_json(app, orjson_backend):
+    """orjson output means the same as that of the standard encoder."""
+    body = {
+        'price': Decimal('1.5'),
+        'tags': {'a'},
+        'date': datetime.datetime(2020, 1, 1),
+        'valid': True,
+        1: 'café',
+        1.5: 'float key',
+        'data': [{'nested': None}],
+    }
+    assert json.use_orjson()
+    assert json_py.loads(json.dumps(body)) == json_py.loads(
+        json.get_encoder().encode(body)
+    )
+    assert json.dumps({'big': 2 ** 70}) == '{"big": 1180591620717411303424}'
+
+
+class Color(enum.Enum):
+    """An enum, which orjson encodes itself."""
+
+    RED = 'r'
+
+
+class Tags(dict):
+    """A subclass of a builtin type."""
+
+
+@pytest.mark.parametrize('body', [{'tags': Tags(a=1)}, {'data': [Tags(a=[1, 2])]}])
+def test_orjson_dumps_exactly_like_json(app, orjson_backend, body):
+    """Bodies with subclasses of builtin types are written by json."""
+    assert json.dumps(body) == json.get_encoder().encode(body)
+
+
+def test_orjson_differences(app, orjson_backend):
+    """NaN, enums and UUIDs are written by orjson, CSV keeps NaN."""
+    assert json.dumps({'price': float('nan')}) == '{"price":null}'
+    assert json.dumps({'color': Color.RED}) == '{"color":"r"}'
+    assert json.dumps({'id': uuid.UUID(int=1)}) == (
+        '{"id":"00000000-0000-0000-0000-000000000001"}'
+    )
+    assert csv.dumps({'data': [{'price': float('nan')}]}).split()[-1] == 'NaN'
+
+
+def test_orjson_loads_like_json(app, orjson_backend):
+    """orjson input is decoded, the standard parser is used as fallback."""
+    loaded = json.loads('{"data": [{"date": "2020-01-01"}]}')
+    assert isinstance(loaded['data'][0]['date'], datetime.datetime)
+    assert json.loads('{"big": 1180591620717411303424}')['big'] == 2 ** 70
+    with pytest.raises(MalformedRequestException):
+        json.loads('{"a":')
+
+
+@pytest.mark.parametrize('pretty', [False, True])
+def test_json_iterdumps_matches_dumps(pretty):
+    """Streaming a generator under data gives the same JSON as dumps."""
+    docs = [{'a': 1, 'b': ['x', {'c': 'y'}]}, {'a': 2}]
+    expected = json.dumps({'status': 'ok', 'data': docs}, pretty=pretty)
+    body = {'status': 'ok', 'data': (doc for doc in docs)}
+    assert ''.join(json.iterdumps(body, pretty=pretty)) == expected
+
+
+def test_renderer_streams_iterators(app):
+    """The renderer returns an app_iter when data is an iterator."""
+    request = testing.DummyRequest(path_extension='.json')
+    result = renderer(
+        {'data': (i for i in range(3))}, {'request': request, 'context': None}
+    )
+    assert json_py.loads(b''.join(result).decode()) == {
+        'status': 'ok',
+        'data': [0, 1, 2],
+    }
+
+
+def test_renderer_stream_errors_before_response(app):
+    """Errors in the first chunk of a stream are raised by the renderer."""
+    request = testing.DummyRequest(path_extension='.csv')
+    with pytest.raises(AttributeError):
+        renderer({'data': [1, 2]}, {'request': request, 'context': None})
+
+
+def test_csv_iterdumps_generator():
+    """CSV can be streamed from a generator, in chunks of rows."""
+    docs = [{'a': i, 'b': 'x'} for i in range(5)]
+    chunks = list(csv.iterdumps({'data': (doc for doc in docs)}))
+    assert ''.join(chunks) == csv.dumps({'data': docs})
+    assert ''.join(chunks).split('\r\n')[1] == '0,"x"'
+
+
+def test_csv_dumps_empty_generator():
+    """An empty generator is dumped as an empty list, in JSON."""
+    assert json_py.loads(csv.dumps({'data': iter([])})) == {'data': []}
+
+
+def test_csv_dumps_nested_and_missing_cells():
+    """Only nested values go through JSON, missing cells are quoted spaces."""
+    data = {'data': [{'a': {'b': [1, None]}, 'c': 1.5}, {'c': None}]}
+    lines = csv.dumps(data).split('\r\n')
+    assert lines[1] == "'{\"b\": [1, null]}',1.5"
+    assert lines[2] == '" ",null'
+
+
+def test_decoder_decode_structure(app):
+    """SpynlDecoder.decode decodes nested dicts like json.loads would."""
+    structure = {'filter': {'date': '2020-01-01', 'list': [{'date': '2021-01-01'}]}}
+    expected = json_py.loads(
+        json_py.dumps(structure), object_hook=SpynlDecoder(context=None)
+    )
+    assert SpynlDecoder(context=None).decode(structure) == expected
+    assert isinstance(structure['filter']['list'][0]['date'], datetime.datetime)
+
+
+def test_decoder_only_touches_registered_fields(app):
+    """Only registered fields are decoded, bytes only if asked for."""
+    dic = {'date': '2020-01-01', 'name': b'caf\xc3\xa9', 'other': 1}
+    SpynlDecoder(decode_bytes=False)(dic)
+    assert isinstance(dic['date'], datetime.datetime)
+    assert dic['name'] == b'caf\xc3\xa9'
+    assert SpynlDecoder()({'name': b'caf\xc3\xa9'}) == {'name': 'caf\xe9'}
+    nested = {'x': {'date': 'not decoded'}}
+    assert SpynlDecoder()(nested) == {'x': {'date': 'not decoded'}}
+
+
+def test_decoder_is_reused_per_request(app):
+    """One decoder is made per request and context."""
+    manager = threadlocal.manager
+    registry = manager.get()['registry']
+    manager.push({'request': testing.DummyRequest(), 'registry': registry})
+    try:
+        decoder = get_decoder(context=None)
+        assert get_decoder(context=None) is decoder
+        assert get_decoder(context=None, decode_bytes=False) is not decoder
+        assert get_decoder(context=object()) is not decoder
+    finally:
+        manager.pop()
+
+
+def test_encode_date_columns(app):
+    """Dates are encoded in bulk to the same strings, without changing the input."""
+    start = datetime.datetime(2020, 3, 29)
+    docs = [
+        {'time': start + datetime.timedelta(minutes=i), 'value': i} for i in range(5)
+    ]
+    encoded = encode_date_columns(docs)
+    assert json.dumps({'data': encoded}) == json.dumps({'data': docs})
+    assert encoded[0]['time'] == date_to_str(localize_date(start))
+    assert isinstance(docs[0]['time'], datetime.datetime)
+
+
+def test_encode_table_dispatches_by_exact_type():
+    """The function for a type is resolved once, then found by exact type."""
+    table = EncodeTable({bool: lambda obj: str(obj).lower()})
+    assert [table.encode(value) for value in (True, False, True)] == [
+        'true',
+        'false',
+        'true',
+    ]
+    assert bool in table.dispatch
+
+
+def test_encode_table_counts_hits():
+    """Lookups after the first one for a type are counted as hits."""
+    assert not hasattr(EncodeTable({}), 'hits')
+    table = CountingEncodeTable({bool: lambda obj: str(obj).lower()})
+    assert [table.encode(value) for value in (True, False, True)] == [
+        'true',
+        'false',
+        'true',
+    ]
+    assert table.hits[bool] == 2
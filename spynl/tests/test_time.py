@@ -1,11 +1,21 @@
 """Tests regarding datetime for spynl.main."""
 
 from datetime import datetime
+from types import SimpleNamespace
 from json import loads
+import threading
 import pytz
 import pytest
 
-from spynl.main.dateutils import now, localize_date, date_to_str
+from spynl.main.dateutils import (
+    now,
+    localize_date,
+    date_to_str,
+    date_from_str,
+    date_parse_stats,
+    DateContext,
+    get_timezone,
+)
 
 
 def test_now():
@@ -45,3 +55,54 @@ def test_get_time(app):
     dt = datetime.now(tz=pytz.UTC).strftime('%Y-%m-%dT%H:%M')
     server_time = response['server_time']
     assert dt in server_time
+
+
+def test_date_from_str_fast_path():
+    """ISO dates do not need dateutil, other formats still work."""
+    hits, misses = date_parse_stats['hit'], date_parse_stats['miss']
+    dt = date_from_str('2014-10-03T04:15:00+0200')
+    assert dt == datetime(2014, 10, 3, 2, 15, tzinfo=pytz.utc)
+    assert date_from_str('2014-10-03') == datetime(2014, 10, 3, tzinfo=pytz.utc)
+    assert date_parse_stats['hit'] == hits + 2
+
+    dt = date_from_str('3 Oct 2014 4:15')
+    assert dt == datetime(2014, 10, 3, 4, 15, tzinfo=pytz.utc)
+    assert date_parse_stats['miss'] == misses + 1
+
+
+def test_date_parse_stats_threads():
+    """Dates parsed in several threads are all counted."""
+    hits = date_parse_stats['hit']
+
+    def parse():
+        for _ in range(500):
+            date_from_str('2014-10-03')
+
+    threads = [threading.Thread(target=parse) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert date_parse_stats.as_dict()['hit'] == hits + 2000
+
+
+def test_date_context():
+    """The date context resolves the timezone of the user once."""
+    calls = []
+
+    def user_info(request, purpose):
+        calls.append(purpose)
+        return {'tz': 'Europe/Amsterdam'}
+
+    request = SimpleNamespace(
+        registry=SimpleNamespace(settings={'user_info_function': user_info})
+    )
+    context = DateContext({'spynl.date_format': '%Y-%m-%d %H:%M'}, request)
+    dt = datetime(2014, 10, 3, 4, 15, 00)
+    assert context.to_str(context.localize(dt)) == '2014-10-03 06:15'
+    assert context.to_str(context.localize(dt, user_specific=False)) == (
+        '2014-10-03 04:15'
+    )
+    context.localize(dt)
+    assert calls == [None]
+    assert context.user_tz is get_timezone('Europe/Amsterdam')
@@ -0,0 +1,81 @@
+"""Test the timing of requests."""
+
+import pytest
+
+from spynl.main.timing import BUCKETS, UNMATCHED, Histogram, RequestTimings
+
+
+@pytest.fixture
+def timed_app(app_factory, settings):
+    """An app which times requests."""
+    return app_factory(dict(settings, **{'spynl.timing': 'true'}))
+
+
+def test_server_timing_header(timed_app):
+    """The stages of the request are in the Server-Timing header."""
+    header = timed_app.get('/ping').headers['Server-Timing']
+    stages = [part.split(';')[0] for part in header.split(', ')]
+    for stage in (
+        'split_extension',
+        'prepare_content_types',
+        'parse_args_and_log_request',
+        'view',
+        'renderer',
+        'corsify_response',
+        'total',
+    ):
+        assert stage in stages
+    assert stages[-1] == 'total'
+
+
+def test_about_timings(timed_app):
+    """The histograms of the requests can be seen at /about/timings."""
+    for _ in range(3):
+        timed_app.get('/ping')
+    response = timed_app.get('/about/timings').json
+    assert response['enabled'] is True
+    assert response['timings']['/ping']['total']['count'] == 3
+    # the time in the response of ping is encoded
+    assert response['encode_hits']['datetime.datetime'] >= 2
+
+
+def test_about_timings_date_parses(timed_app):
+    """Dates parsed from the body are counted at /about/timings."""
+    hits = timed_app.get('/about/timings').json['date_parses']['hit']
+    timed_app.post('/ping', '{"date": "2020-01-01"}')
+    assert timed_app.get('/about/timings').json['date_parses']['hit'] == hits + 1
+
+
+def test_unmatched_requests_share_histogram(timed_app):
+    """Requests which got to no view are kept together, whatever the path."""
+    for path in ('/nothing-here', '/nothing-there', '/or/here'):
+        timed_app.get(path, status=404)
+    timings = timed_app.get('/about/timings').json['timings']
+    assert timings[UNMATCHED]['total']['count'] == 3
+    assert not any('nothing' in endpoint for endpoint in timings)
+
+
+def test_no_timing_by_default(app):
+    """Without spynl.timing, there is no header."""
+    assert 'Server-Timing' not in app.get('/ping').headers
+
+
+def test_histogram():
+    """Durations are counted in the bucket of their upper bound."""
+    histogram = Histogram()
+    for milliseconds in (0.5, 1, 3, 10 ** 6):
+        histogram.add(milliseconds)
+    result = histogram.as_dict()
+    assert result['count'] == 4
+    assert result['max_ms'] == 10 ** 6
+    assert result['buckets']['<=1'] == 2
+    assert result['buckets']['<=5'] == 1
+    assert result['buckets']['>{}'.format(BUCKETS[-1])] == 1
+
+
+def test_request_timings_add_up():
+    """Durations of a stage measured twice are added."""
+    timings = RequestTimings()
+    timings.add('view', 0.001)
+    timings.add('view', 0.002)
+    assert timings.server_timing() == 'view;dur=3.00'
@@ -197,3 +197,11 @@ def test_loads_nested():
         'c': [],
         'd': [{'f': '1'}, 'd'],
     }
+
+
+def test_loads_long_query():
+    """Test a long filter query (loads)."""
+    query = '{' + ','.join('f%d:[a,{b:%d}]' % (i, i) for i in range(2000)) + '}'
+    result = loads(query)
+    assert len(result) == 2000
+    assert result['f1999'] == ['a', {'b': '1999'}]
@@ -0,0 +1,60 @@
+"""Tests for caching user information."""
+
+from types import SimpleNamespace
+
+from spynl.main.utils import get_user_info, forget_user_info, cache_user_info
+
+
+def make_request(user_info_function, userid=None):
+    registry = SimpleNamespace(settings={'user_info_function': user_info_function})
+    return SimpleNamespace(
+        registry=registry, user_info_cache={}, authenticated_userid=userid
+    )
+
+
+def test_user_info_is_cached_per_purpose():
+    calls = []
+
+    def user_info(request, purpose):
+        calls.append(purpose)
+        return {'tz': 'Europe/Amsterdam', 'purpose': purpose}
+
+    request = make_request(user_info)
+    assert get_user_info(request)['tz'] == 'Europe/Amsterdam'
+    get_user_info(request)
+    assert get_user_info(request, purpose='error_view')['purpose'] == 'error_view'
+    assert calls == [None, 'error_view']
+
+    forget_user_info(request)
+    get_user_info(request)
+    assert calls == [None, 'error_view', None]
+
+
+def test_cache_user_info_across_requests():
+    calls = []
+
+    @cache_user_info(ttl=60)
+    def user_info(request, purpose):
+        calls.append(request.authenticated_userid)
+        return {'username': request.authenticated_userid}
+
+    assert get_user_info(make_request(user_info, 'kim')) == {'username': 'kim'}
+    assert get_user_info(make_request(user_info, 'kim')) == {'username': 'kim'}
+    get_user_info(make_request(user_info, 'sam'))
+    # anonymous requests are not cached
+    get_user_info(make_request(user_info))
+    get_user_info(make_request(user_info))
+    assert calls == ['kim', 'sam', None, None]
+
+
+def test_cache_user_info_expires():
+    calls = []
+
+    @cache_user_info(ttl=0)
+    def user_info(request, purpose):
+        calls.append(purpose)
+        return {}
+
+    get_user_info(make_request(user_info, 'kim'))
+    get_user_info(make_request(user_info, 'kim'))
+    assert len(calls) == 2